@@ -4,58 +4,17 @@
 # physiological and lifestyle factors on functional brain connectivity"       #
 ###############################################################################
 
-import pandas as pd
-import os
 import matplotlib.pyplot as plt
 
-from statsmodels.tsa.stattools import adfuller
-from sklearn.linear_model import LinearRegression
-
 import seaborn as sns
 
+import pvt
+import trends
+
 path = "./data/pilot_i/PVT/"
 savepath = "./results/pilot_i/"
 
-files = []
-for file in os.listdir(os.path.abspath(path)):
-    if file.endswith("_pvt_log.txt"): 
-        files.append(file)
-files.sort()
-
-performance = [None]*len(files)
-median = [None]*len(files)
-fast = [None]*len(files)
-mean_1_RT = [None]*len(files)
-slow_1_RT = [None]*len(files)
-no_lapse_false = [None]*len(files)
-lapse_prob = [None]*len(files)
-
-for file in files:    
-    pvt = pd.read_csv(os.path.join(path, file), sep="\t", header=[0])
-    
-    idx = int(file[-14:-12])-1
-    
-    pvt['1_RT'] = 1000/pvt.RT
-    
-    no_false = len(pvt[pvt['Category']=='false']) + len(pvt[pvt['RT']<=100])
-    no_lapse = len(pvt[pvt['RT']>500])
-    no_lapse_false[idx] = no_false + no_lapse
-    performance[idx] = 1-(no_lapse_false[idx]/len(pvt))
-    lapse_prob[idx] = no_lapse/(len(pvt) - no_false)
-    
-    pvt.drop(pvt[pvt.Category=="false"].index, inplace=True)
-    
-    median[idx] = pvt.RT.quantile(0.5)
-    fast[idx] = pvt.RT.quantile(0.1)
-    mean_1_RT[idx] = pvt["1_RT"].mean()
-    slow_1_RT[idx] = pvt["1_RT"].quantile(0.9)
-    print(file)
-
-pvt_results = {"mean_1_RT": mean_1_RT, "median": median, "slow_1_RT": slow_1_RT,
-               "fast": fast, "no_lapse_false": no_lapse_false, "lapse_prob": lapse_prob,
-               "performance": performance}
-
-pvt_results = pd.DataFrame.from_dict(pvt_results)
+pvt_results = pvt.score_logs(path).reset_index(drop=True) #row i is day i+1
 
 ############################### Plot PVT #####################################
 pvt_results["day"] = pvt_results.index +1
@@ -98,15 +57,10 @@ plt.savefig(savepath+"SupplementaryFigure2.pdf")
 
 ################################ Test for stationarity #######################
 
-for col in pvt_results.columns:
-    result = adfuller(pvt_results[col].values)
-    print(col)
-    print('ADF Statistic: %f' % result[0])
-    print('p-value: %f' % result[1])
-    print('Critical Values:')
-    for key, value in result[4].items():
-        print('\t%s: %.3f' % (key, value))
-    print('............................................')
+#one ADF test per score (not the day itself), all solved together
+stationarity = trends.adf(pvt_results[cols])
+print(stationarity[['adf', 'pvalue', 'usedlag', '1%', '5%', '10%']].round(3))
+print('............................................')
     
 # We see some features are stationary, e.g. mean 1/RT (at p<0.05), number of lapses 
 # (p<0.01), probability of lapses (p<0.05), and performance (p<0.01).
@@ -120,12 +74,7 @@ for col in pvt_results.columns:
 # faster (e.g. if we could fit a line with a negative slope). 
 
 ################################# Trend ######################################
-for col in cols:
-    x = pvt_results["day"].values
-    x = x.reshape(-1,1)
-    y = pvt_results[col].values
-    reg = LinearRegression().fit(x, y)
-    print(f'Regression stats for {col}')
-    print(f'reg. coef: {reg.coef_}')
-    print(f'coef. of determination: {reg.score(x, y)}')
-    print("+++++++++++++++++++++++++++++++++++++++++++++")
\ No newline at end of file
+fit = trends.trend(pvt_results[cols], x=pvt_results["day"])
+print('Regression stats (reg. coef and coef. of determination)')
+print(fit[['slope', 'r2']])
+print("+++++++++++++++++++++++++++++++++++++++++++++")
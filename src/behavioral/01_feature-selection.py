@@ -9,7 +9,6 @@
 import os
 import pandas as pd
 import numpy as np
-from functools import reduce
 from sklearn.decomposition import PCA
 from sklearn.preprocessing import StandardScaler
 
@@ -17,9 +16,13 @@ import seaborn as sns
 import matplotlib.pyplot as plt
 import matplotlib as mpl
 
+import correlation
+import pca_bootstrap
+
 ######################### Pepare paths #######################################
 path = './data/pilot_iii/behavioral/' 
 savepath = './results/pilot_iii/SupplementaryFigure9.pdf'
+bootstrap = 2000 #resamples of the days to check how stable the contributors are
 ##############################################################################
 
 pilot = pd.read_csv(os.path.join(os.path.abspath(path),'sub-01_sensor-oura.csv'))
@@ -29,11 +32,9 @@ cmap = 'seismic'
 # 1. Correlation between measurements as divided by sleep, ANS, and physical activity
 pilot.drop(columns=['date', 'Sleep Timing.1', 'Bedtime Start', 'Bedtime End', 'HRV Balance Score'], inplace=True)
 
-corr = pilot.corr(method='pearson')
-upt = corr.where(abs(np.triu(corr.values, k=0)) > 0.5, other=0)
-lot = corr.where(abs(np.tril(corr.values, k=-1)) > 0, other=0)
-dfs = [upt, lot]
-corr = reduce(lambda x, y: x.add(y, fill_value=0), dfs)
+#running pairwise sums: a new day is added with features.append(row), no recomputation
+features = correlation.PairwiseCorrelation(pilot.select_dtypes('number').columns).append(pilot)
+corr = correlation.triangle(features.corr(), threshold=0.5) #upper triangle only where |r| > 0.5
 
 sleep_cols = ['Total Bedtime', 'Total Sleep Time', 'Awake Time', 'Restless Sleep', 'Sleep Efficiency', 'Sleep Latency', 'Sleep Timing']
 sleep = corr[sleep_cols]
@@ -83,11 +84,8 @@ pca.fit(data)
 
 print(f'Variance explained... {pca.explained_variance_ratio_}') #Check how much each PC explains the variance
 
-pcs = abs(pca.components_)
-num = -4 #the n first contributors to the PC
-for i in range(len(pcs)):
-    ind = np.argpartition(pcs[i], num)[num:]
-    ind[np.argsort(pcs[i][ind])][::-1]
+num = 4 #the n first contributors to the PC
+for i, ind in enumerate(pca_bootstrap.top_contributors(pca.components_, num)): #largest first
     names = [sleep_cols[index] for index in ind]
     print (f'For PC{i+1}, the variables that contribute the most are: {names}')
 
@@ -100,10 +98,14 @@ pca.fit(data)
 
 print(f'Variance explained... {pca.explained_variance_ratio_}') #Check how much each PC explains the variance
 
-pcs = abs(pca.components_)
-num = -4 #the n first contributors to the PC
-for i in range(len(pcs)):
-    ind = np.argpartition(pcs[i], num)[num:]
-    ind[np.argsort(pcs[i][ind])][::-1]
+num = 4 #the n first contributors to the PC
+for i, ind in enumerate(pca_bootstrap.top_contributors(pca.components_, num)): #largest first
     names = [acti_cols[index] for index in ind]
     print (f'For PC{i+1}, the variables that contribute the most are: {names}')
+
+#3 Stability of the contributors over bootstrap resamples of the days
+if __name__ == "__main__":
+    for name, cols, n in [('sleep', sleep_cols, 3), ('activity', acti_cols, 4)]:
+        stability = pca_bootstrap.contributor_stability(pilot[cols], n, top=num, iterations=bootstrap)
+        print(f'Share of {bootstrap} resamples where each {name} variable is a top-{num} contributor')
+        print(stability)
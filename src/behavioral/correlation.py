@@ -0,0 +1,78 @@
+###############################################################################
+# Running Pearson correlation between daily features                          #
+#                                                                             #
+# PairwiseCorrelation keeps, for every pair of columns, the count and sums    #
+# (x, x^2, xy) over the days where both are present, so the matrix equals     #
+# DataFrame.corr() (pairwise complete observations) and a new day updates it  #
+# in O(p^2) without going back to the raw table. Values are shifted by a      #
+# per-column reference (the mean of the first rows) to keep the sums exact.   #
+###############################################################################
+
+import numpy as np
+import pandas as pd
+
+class PairwiseCorrelation:
+    ''' Running nan-aware Pearson correlation of the given columns. '''
+    def __init__(self, columns):
+        p = len(columns)
+        self.columns = pd.Index(columns)
+        self.shift = None
+        self.n = np.zeros((p, p))
+        self.sx = np.zeros((p, p)) #sx[i, j]: sum of column i over the rows where j is present too
+        self.sxx = np.zeros((p, p))
+        self.sxy = np.zeros((p, p))
+
+    def append(self, rows):
+        ''' Add one or more rows (days); a DataFrame, or a Series for a single
+        day, is aligned on the columns.
+        '''
+        if isinstance(rows, pd.Series):
+            rows = rows.to_frame().T
+        if isinstance(rows, pd.DataFrame):
+            rows = rows.reindex(columns=self.columns)
+        rows = np.atleast_2d(np.asarray(rows, dtype=float))
+        if self.shift is None:
+            with np.errstate(invalid='ignore'):
+                self.shift = np.nan_to_num(np.nanmean(rows, axis=0)) if len(rows) else np.zeros(len(self.columns))
+        present = ~np.isnan(rows)
+        values = np.where(present, rows - self.shift, 0.)
+        mask = present.astype(float)
+        self.n += mask.T @ mask
+        self.sx += values.T @ mask
+        self.sxx += (values*values).T @ mask
+        self.sxy += values.T @ values
+        return self
+
+    def corr(self, min_periods=1):
+        ''' Correlation matrix as a DataFrame (nan where fewer than min_periods
+        days have both columns, or one of them is constant on those days).
+        '''
+        with np.errstate(invalid='ignore', divide='ignore'):
+            cov = self.sxy - self.sx*self.sx.T/self.n
+            var = self.sxx - self.sx**2/self.n
+            r = cov/np.sqrt(var*var.T)
+        r[(self.n < max(min_periods, 2)) | (var <= 0) | (var.T <= 0)] = np.nan
+        np.clip(r, -1, 1, out=r)
+        return pd.DataFrame(r, index=self.columns, columns=self.columns)
+
+    def save(self, path):
+        np.savez(path, columns=self.columns.values.astype(str), shift=np.zeros(0) if self.shift is None else self.shift,
+                 n=self.n, sx=self.sx, sxx=self.sxx, sxy=self.sxy)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as arrays:
+            acc = cls(list(arrays['columns']))
+            acc.shift = arrays['shift'] if arrays['shift'].size else None
+            acc.n, acc.sx, acc.sxx, acc.sxy = arrays['n'], arrays['sx'], arrays['sxx'], arrays['sxy']
+        return acc
+
+def triangle(corr, threshold=0.5):
+    ''' corr with the upper triangle (and diagonal) zeroed where |r| is not above
+    threshold, the lower triangle kept in full and nan set to 0.
+    '''
+    r = corr.values
+    i, j = np.indices(r.shape)
+    with np.errstate(invalid='ignore'):
+        keep = np.where(i <= j, np.abs(r) > threshold, np.abs(r) > 0)
+    return pd.DataFrame(np.where(keep, r, 0.), index=corr.index, columns=corr.columns)
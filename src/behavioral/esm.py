@@ -0,0 +1,47 @@
+###############################################################################
+# Daily ESM (questionnaire) tables shared by the behavioral scripts           #
+#                                                                             #
+# The answers are read through the sensor cache (sensors.py), where the       #
+# question ids are category codes, so selecting questions is an integer       #
+# lookup. Prompts are grouped by their local day number and summed with one   #
+# bincount, which is what pivot_table(aggfunc=np.sum) did per date string.    #
+###############################################################################
+
+import numpy as np
+import pandas as pd
+
+import sensors
+
+negative_affect = ['dq_05', 'dq_06', 'dq_07', 'dq_08', 'dq_09', 'dq_10', 'dq_11']
+
+def daily_answers(path, begin, end, questions=negative_affect):
+    ''' Day x question table of the summed answers between begin and end, and
+    its row sum (the negative affect for the default questions).
+
+    As the former pivot: repeated (time, id) prompts count once, a day only
+    appears if one of the questions was prompted, and a question without a
+    prompt that day is nan. Days are in calendar order (local time).
+    '''
+    data = sensors.load(path, ['time', 'id', 'answer'], begin, end)
+    ids = data['id'].values
+    wanted = ids.categories.get_indexer(questions)
+    column = np.full(len(ids.categories) + 1, -1)
+    column[wanted[wanted >= 0]] = np.flatnonzero(wanted >= 0)
+    question = column[ids.codes] #codes of missing ids are -1, the extra slot
+    keep = question >= 0
+    keep[keep] = ~pd.DataFrame({'time': data['time'].values[keep], 'id': question[keep]}).duplicated().values
+
+    answers = data['answer'].values
+    values = pd.to_numeric(answers.categories.to_series(), errors='coerce').values
+    values = np.append(values, np.nan)[answers.codes[keep]]
+    day = data.index[keep].tz_localize(None).asi8 // (24*3600*10**9)
+    days, day = np.unique(day, return_inverse=True)
+
+    cell = day * len(questions) + question[keep]
+    size = len(days) * len(questions)
+    sums = np.bincount(cell, weights=np.nan_to_num(values), minlength=size)
+    prompted = np.bincount(cell, minlength=size) > 0
+    table = pd.DataFrame(np.where(prompted, sums, np.nan).reshape(len(days), len(questions)),
+                         index=pd.to_datetime(days, unit='D').rename('date'),
+                         columns=pd.Index(questions, name='id'))
+    return table, table.sum(axis=1).rename('neg affect')
@@ -0,0 +1,52 @@
+###############################################################################
+# Gap index for the missing-data plots                                        #
+#                                                                             #
+# The missing samples of a stream are run-length encoded in one vectorized    #
+# pass (start and end position of every gap), which gives the coverage        #
+# statistics and lets a whole panel of gaps be drawn as one collection.       #
+###############################################################################
+
+import numpy as np
+import pandas as pd
+from matplotlib.collections import PolyCollection
+
+def gap_index(df):
+    ''' Gaps of df (rows with any missing value) as {'starts', 'ends'} sample
+    positions, ends exclusive, plus the coverage statistics of the stream.
+    '''
+    missing = np.asarray(pd.DataFrame(df).isnull().any(axis=1))
+    edges = np.diff(np.concatenate(([0], missing.astype(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    lengths = ends - starts
+    return {'starts': starts, 'ends': ends,
+            'samples': len(missing),
+            'missing': int(lengths.sum()),
+            'percent': round(100*lengths.sum()/len(missing), 2) if len(missing) else 0.,
+            'gaps': len(starts),
+            'longest': int(lengths.max()) if len(starts) else 0}
+
+def coverage(stats):
+    ''' Table of the coverage statistics (samples, missing, percent, gaps,
+    longest gap) per stream, from a {name: gap_index(df)} dict.
+    '''
+    cols = ['samples', 'missing', 'percent', 'gaps', 'longest']
+    return pd.DataFrame.from_dict(stats, orient='index')[cols]
+
+def highlight_gaps(df, ax, gaps=None, **kwargs):
+    ''' Shade every gap of df on ax with a single collection. A gap spans from
+    the sample before it to the sample after it, like one axvspan per missing
+    sample used to (clipped to the first and last sample).
+    '''
+    gaps = gaps or gap_index(df)
+    if not gaps['gaps']:
+        return None
+    last = len(df.index) - 1
+    x0 = ax.convert_xunits(df.index[np.maximum(gaps['starts'] - 1, 0)])
+    x1 = ax.convert_xunits(df.index[np.minimum(gaps['ends'], last)])
+    verts = np.stack([np.column_stack([x0, np.zeros_like(x0)]), np.column_stack([x0, np.ones_like(x0)]),
+                      np.column_stack([x1, np.ones_like(x1)]), np.column_stack([x1, np.zeros_like(x1)])], axis=1)
+    kwargs = {'facecolor': 'tomato', 'edgecolor': 'none', **kwargs}
+    collection = PolyCollection(verts, transform=ax.get_xaxis_transform(), **kwargs)
+    ax.add_collection(collection, autolim=False)
+    return collection
@@ -0,0 +1,435 @@
+###############################################################################
+# Missingness generators and imputers used by 01_imputation.py                #
+#                                                                             #
+# The functions live here (and not in the script) so that the Monte Carlo     #
+# engine in montecarlo.py can ship them to worker processes.                  #
+#                                                                             #
+# The cheap imputers (mean, mode, zero, regression and interpolation) also    #
+# have batched versions that evaluate thousands of masks at once in numpy,    #
+# and KNN, IterativeImputer and mice have versions that reuse the distances   #
+# and regressions the masks do not change.                                    #
+###############################################################################
+
+import numpy as np
+import pandas as pd
+
+from sklearn.impute import SimpleImputer
+from sklearn.impute import KNNImputer
+from sklearn.experimental import enable_iterative_imputer
+from sklearn.impute import IterativeImputer
+from sklearn.linear_model import LinearRegression
+from impyute.imputation.cs import mice
+
+from sklearn.metrics import mean_squared_error
+
+from montecarlo import iteration_rng
+import esm
+
+sleep_cols = ['Total Sleep Time', 'Awake Time', 'Restless Sleep', 'Sleep Efficiency', 'Sleep Latency']
+activity_cols = ['Target Calories', 'Steps', 'Inactive Time', 'Rest Time', 'High Activity Time', 'Non-wear Time', 'Long Periods of Inactivity']
+all_cols = ['date','Total Sleep Time', 'Awake Time', 'Restless Sleep', 'Sleep Efficiency', 'Sleep Latency', 'Target Calories', 'Steps', 'Inactive Time', 'Rest Time', 'High Activity Time', 'Non-wear Time', 'Long Periods of Inactivity']
+
+sleep_methods = ['mean','common', 'zero', 'linear', 'knn', 'iterative', 'interpolation', 'imice']
+ema_methods = ['mean','common', 'zero', 'knn', 'iterative', 'interpolation', 'imice']
+batch_methods = ['mean','common', 'zero', 'linear', 'interpolation']
+precomputed_methods = ['knn', 'iterative', 'imice']
+
+######################### Load data ##########################################
+def load_sleep(path):
+    pilot = pd.read_csv(f'{path}/sub-01_sensor-oura.csv')
+    pilot.drop(['Sleep Timing.1', 'Bedtime Start','Bedtime End', 'HRV Balance Score'], axis=1, inplace=True)
+    #HRV balance has some nans randomly placed and we do not know why exactly it is. This may be related to
+    #the Oura own algorithm and therefore, we drop the column so that it will not make us drop more rows
+    #when dropping nans.
+    pilot.dropna(axis=0, inplace=True)
+    pilot = pilot [all_cols]
+
+    gold = pilot.copy()
+    gold.reset_index(inplace=True)
+    #For tetsing and comparison purposes, we will assume these values are the same as the preceeding night
+    #This is only for comparing the imputers' performance.
+
+    pilot.set_index("date", inplace=True)
+    return pilot, gold
+
+def load_ema(path, begin, end):
+    pilot, _ = esm.daily_answers(f'{path}/sub-01_sensor-esm.csv', begin, end)
+
+    gold = pilot.copy()
+    gold.reset_index(inplace=True)
+    gold.drop(columns=['date'], inplace=True)
+    return pilot, gold
+
+######################### Sleep ##############################################
+def generate_missing_sleep(pilot, column, rng):
+    df = pilot.copy()
+    ids = rng.choice(np.arange(1, len(df)), size=round(.2*len(df)), replace=False) #The first observations cannot be missing
+    #We have observed from the data, that usually either sleep data is lost, but not activity data.
+    #Then, we will assume the same missingness structure that we have observed to create our
+    #artificial missingness.
+    for i in ids:
+        df.loc[df.index[i],sleep_cols] = np.nan
+
+    miss_ids = np.flatnonzero(df[column].isna().values).tolist()
+    #We store the indices of the artificial missing data values.
+    return df, miss_ids
+
+def impute_data_sleep(pilot, miss_ids, methods=sleep_methods):
+    imputed_data = dict.fromkeys(methods)
+
+    if 'mean' in methods:
+        mean_imp = SimpleImputer(missing_values=np.nan, strategy='mean')
+        imputed_data['mean'] =  mean_imp.fit_transform(pilot.values)
+
+    if 'common' in methods:
+        common_imp = SimpleImputer(missing_values=np.nan, strategy='most_frequent')
+        imputed_data['common'] =  common_imp.fit_transform(pilot.values)
+
+    if 'zero' in methods:
+        zero_imp = SimpleImputer(missing_values=np.nan, strategy='constant')
+        imputed_data['zero'] =  zero_imp.fit_transform(pilot.values)
+
+    if 'linear' in methods:
+        linear_imp = LinearRegression()
+        pilot_nonmiss = pilot.dropna(axis=0)
+        pilot_miss = pilot[pilot[sleep_cols[0]].isna()]
+        reg = linear_imp.fit(pilot_nonmiss[activity_cols], pilot_nonmiss[sleep_cols])
+        imputed_data['linear'] = reg.predict(pilot_miss[activity_cols])
+
+    if 'knn' in methods:
+        knn_imp = KNNImputer(n_neighbors=5, weights="distance")
+        imputed_data['knn'] = knn_imp.fit_transform(pilot.values)
+
+    if 'iterative' in methods:
+        iter_imp = IterativeImputer(random_state=0)
+        imputed_data['iterative'] = iter_imp.fit_transform(pilot.values)
+
+    if 'interpolation' in methods:
+        interp_data = pilot.interpolate(method='linear', limit_direction='forward', axis=0)
+        imputed_data['interpolation'] = interp_data.to_numpy()
+
+    if 'imice' in methods:
+        imputed_data['imice'] = mice(pilot.values)
+
+    for key in imputed_data.keys():
+        if key!='linear':
+            imputed_data[key] = imputed_data[key][miss_ids,0:5]
+
+    return imputed_data
+
+def sleep_iteration(pilot, gold, methods=sleep_methods, rng=None, column="Total Sleep Time"):
+    ''' One Monte Carlo round for the sleep data: returns the MSE per imputer.
+    '''
+    pilot_miss, miss_ids = generate_missing_sleep(pilot, column, rng)
+    np.random.seed(rng.integers(2**32)) #impyute's mice draws from the global numpy RNG
+    imputed_data = impute_data_sleep(pilot_miss, miss_ids, methods)
+    y_true = gold.loc[gold.index[miss_ids],sleep_cols].values
+    return {key: mean_squared_error(y_true, imputed_data[key], squared=True) for key in imputed_data.keys()}
+
+######################### EMA ################################################
+def generate_missing_EMA(pilot, column, rng):
+    df = pilot.copy()
+    ids = rng.choice(np.arange(1, len(df)), size=round(.2*len(df)), replace=False)
+    for i in ids:
+        df.loc[df.index[i],:] = np.nan
+
+    miss_ids = np.flatnonzero(df[column].isna().values).tolist()
+    #We store the indices of the artificial missing data values.
+    return df, miss_ids
+
+def impute_data_EMA(pilot, miss_ids, methods=ema_methods):
+    imputed_data = dict.fromkeys(methods)
+
+    if 'mean' in methods:
+        mean_imp = SimpleImputer(missing_values=np.nan, strategy='mean')
+        imputed_data['mean'] =  mean_imp.fit_transform(pilot.values)
+
+    if 'common' in methods:
+        common_imp = SimpleImputer(missing_values=np.nan, strategy='most_frequent')
+        imputed_data['common'] =  common_imp.fit_transform(pilot.values)
+
+    if 'zero' in methods:
+        zero_imp = SimpleImputer(missing_values=np.nan, strategy='constant')
+        imputed_data['zero'] =  zero_imp.fit_transform(pilot.values)
+
+    if 'knn' in methods:
+        knn_imp = KNNImputer(n_neighbors=5, weights="distance")
+        imputed_data['knn'] = knn_imp.fit_transform(pilot.values)
+
+    if 'iterative' in methods:
+        iter_imp = IterativeImputer(random_state=0)
+        imputed_data['iterative'] = iter_imp.fit_transform(pilot.values)
+
+    if 'interpolation' in methods:
+        interp_data = pilot.interpolate(method='linear', limit_direction='forward', axis=0)
+        imputed_data['interpolation'] = interp_data.to_numpy()
+
+    if 'imice' in methods:
+        imputed_data['imice'] = mice(pilot.values)
+
+    for key in imputed_data.keys():
+        imputed_data[key] = imputed_data[key][miss_ids,:]
+
+    return imputed_data
+
+def ema_iteration(pilot, gold, methods=ema_methods, rng=None, column="dq_05"):
+    ''' One Monte Carlo round for the EMA data: returns the MSE per imputer.
+    '''
+    pilot_miss, miss_ids = generate_missing_EMA(pilot, column, rng)
+    np.random.seed(rng.integers(2**32)) #impyute's mice draws from the global numpy RNG
+    imputed_data = impute_data_EMA(pilot_miss, miss_ids, methods)
+    y_true = gold.loc[gold.index[miss_ids],:].values
+    return {key: mean_squared_error(y_true, imputed_data[key], squared=True) for key in imputed_data.keys()}
+
+######################### Batched imputers ##################################
+# Each function takes the data (n x p), a (batch x n x p) mask of the observed
+# values and returns the imputed table for the whole batch (broadcastable to
+# batch x n x p). They reproduce the sklearn/pandas imputers above.
+
+def missing_masks(n, seed, start, stop):
+    ''' Rows blanked by iterations start..stop-1, as a (stop-start) x n boolean tensor.
+
+    The draws are the ones of sleep_iteration/ema_iteration, so a batched run
+    sees exactly the masks of the per-iteration run with the same seed. Also
+    returns the seeds those iterations give to the global numpy RNG (for mice).
+    '''
+    masks = np.zeros((stop-start, n), dtype=bool)
+    seeds = np.zeros(stop-start, dtype=np.int64)
+    for row, i in enumerate(range(start, stop)):
+        rng = iteration_rng(seed, i)
+        masks[row, rng.choice(np.arange(1, n), size=round(.2*n), replace=False)] = True
+        seeds[row] = rng.integers(2**32)
+    return masks, seeds
+
+def batch_mean(values, observed):
+    total = np.where(observed, values, 0).sum(axis=1, keepdims=True)
+    return total / observed.sum(axis=1, keepdims=True)
+
+def batch_mode(values, observed):
+    #As SimpleImputer(strategy='most_frequent'), ties go to the smallest value
+    mode = np.empty((observed.shape[0], 1, values.shape[1]))
+    for col in range(values.shape[1]):
+        uniques, inverse = np.unique(values[:, col], return_inverse=True)
+        counts = observed[:, :, col].astype(float) @ np.eye(len(uniques))[inverse]
+        mode[:, 0, col] = uniques[counts.argmax(axis=1)]
+    return mode
+
+def batch_zero(values, observed):
+    return np.zeros((1, 1, values.shape[1]))
+
+def batch_interpolation(values, observed):
+    #As DataFrame.interpolate(method='linear', limit_direction='forward'): values
+    #after the last observation take the last observation, leading gaps stay nan
+    n = values.shape[0]
+    rows = np.arange(n)[None, :, None]
+    cols = np.arange(values.shape[1])
+    prev = np.maximum.accumulate(np.where(observed, rows, -1), axis=1)
+    nxt = np.minimum.accumulate(np.where(observed, rows, n)[:, ::-1], axis=1)[:, ::-1]
+    has_next = nxt < n
+    nxt = np.where(has_next, nxt, prev)
+    y0 = values[prev, cols]
+    slope = (values[nxt, cols] - y0) / np.where(nxt > prev, nxt - prev, 1)
+    imputed = np.where(has_next, slope*(rows - prev) + y0, y0)
+    return np.where(prev < 0, np.nan, imputed)
+
+def batch_linear(features, values, masks):
+    #As LinearRegression fit on the rows each mask keeps. The data must be complete
+    #and every mask must blank the same number of rows (as missing_masks does).
+    batch, n = masks.shape
+    keep = np.nonzero(~masks)[1].reshape(batch, -1)
+    x_mean = features[keep].mean(axis=1, keepdims=True)
+    y_mean = values[keep].mean(axis=1, keepdims=True)
+    #min-norm least squares on centered data, like sklearn's lstsq
+    coef = np.linalg.pinv(features[keep] - x_mean) @ (values[keep] - y_mean)
+    return (features[None] - x_mean) @ coef + y_mean
+
+######################### Precomputed imputers ##############################
+# KNN, IterativeImputer and mice refit everything on every mask, although the
+# masks only blank whole rows: the rows a mask keeps are fully observed, so
+# every regression is fit on real data only and does not change while the
+# imputer iterates, and the distances on the never-blanked columns are the
+# same for all masks. These versions compute those pieces once (per batch, or
+# once for all) and only redo the work on the blanked rows.
+
+def knn_distances(values, observed_cols):
+    ''' nan_euclidean distances between all rows, as seen by KNNImputer for a
+    row whose only observed columns are observed_cols. None if there are none.
+    '''
+    if len(observed_cols) == 0:
+        return None
+    x = values[:, observed_cols]
+    sq_dist = ((x[:, None, :] - x[None, :, :])**2).sum(axis=2)
+    return np.sqrt(values.shape[1] / len(observed_cols) * sq_dist)
+
+def batch_knn(dist, values, observed, masks, n_neighbors=5):
+    #As KNNImputer(n_neighbors=5, weights="distance"); without distances (the
+    #blanked rows have nothing observed) it falls back to the column mean
+    if dist is None:
+        return batch_mean(values, observed)
+    batch, n = masks.shape
+    miss = np.nonzero(masks)[1].reshape(batch, -1)
+    keep = np.nonzero(~masks)[1].reshape(batch, -1)
+    n_neighbors = min(n_neighbors, keep.shape[1])
+    dist = dist[miss[:, :, None], keep[:, None, :]]
+    nearest = np.argpartition(dist, n_neighbors - 1, axis=2)[:, :, :n_neighbors]
+    with np.errstate(divide='ignore'):
+        weights = 1.0 / np.take_along_axis(dist, nearest, axis=2)
+    exact = np.isinf(weights)
+    weights = np.where(exact.any(axis=2, keepdims=True), exact, weights)
+    donors = values[np.take_along_axis(keep[:, None, :], nearest, axis=2)]
+    imputed = np.broadcast_to(values, (batch,) + values.shape).copy()
+    rows = np.arange(batch)[:, None]
+    imputed[rows, miss] = (weights[..., None] * donors).sum(axis=2) / weights.sum(axis=2)[..., None]
+    return imputed
+
+def _fit_models(values, targets, masks, regression):
+    #One regression per (mask, target column) on the kept rows, the other
+    #columns as predictors. Returns coef (batch x targets x p-1), intercept.
+    batch, n = masks.shape
+    keep = np.nonzero(~masks)[1].reshape(batch, -1)
+    others = [np.delete(np.arange(values.shape[1]), col) for col in targets]
+    x = np.stack([values[keep][:, :, cols] for cols in others], axis=1)
+    y = np.stack([values[keep, col] for col in targets], axis=1)
+    return regression(x, y)
+
+def _linear_regression(x, y):
+    #LinearRegression (min-norm least squares on centered data) for stacked problems
+    x_mean = x.mean(axis=-2, keepdims=True)
+    y_mean = y.mean(axis=-1, keepdims=True)
+    coef = (np.linalg.pinv(x - x_mean) @ (y - y_mean)[..., None])[..., 0]
+    return coef, y_mean[..., 0] - (x_mean[..., 0, :] * coef).sum(axis=-1)
+
+def _bayesian_ridge(x, y, n_iter=300, tol=1.e-3):
+    #BayesianRidge with its default priors for stacked problems; every model
+    #stops updating alpha and lambda once it has converged, as in sklearn
+    eps = np.finfo(np.float64).eps
+    x_mean = x.mean(axis=-2, keepdims=True)
+    y_mean = y.mean(axis=-1, keepdims=True)
+    x = x - x_mean
+    y = y - y_mean
+    n_samples = x.shape[-2]
+    xt_y = (np.swapaxes(x, -1, -2) @ y[..., None])[..., 0]
+    _, s, vh = np.linalg.svd(x, full_matrices=False)
+    eigen_vals = s**2
+    alpha = 1.0 / (np.var(y, axis=-1) + eps)
+    lambda_ = np.ones_like(alpha)
+    active = np.ones(alpha.shape, dtype=bool)
+
+    def update_coef(alpha, lambda_):
+        scaled = vh / (eigen_vals + (lambda_ / alpha)[..., None])[..., None]
+        coef = (np.swapaxes(vh, -1, -2) @ (scaled @ xt_y[..., None]))[..., 0]
+        rmse = ((y - (x @ coef[..., None])[..., 0])**2).sum(axis=-1)
+        return coef, rmse
+
+    coef_old = None
+    for i in range(n_iter):
+        coef, rmse = update_coef(alpha, lambda_)
+        gamma = ((alpha[..., None] * eigen_vals) / (lambda_[..., None] + alpha[..., None] * eigen_vals)).sum(axis=-1)
+        lambda_ = np.where(active, (gamma + 2e-6) / ((coef**2).sum(axis=-1) + 2e-6), lambda_)
+        alpha = np.where(active, (n_samples - gamma + 2e-6) / (rmse + 2e-6), alpha)
+        if i != 0:
+            active &= np.abs(coef_old - coef).sum(axis=-1) >= tol
+            if not active.any():
+                break
+        coef_old = coef
+    coef, _ = update_coef(alpha, lambda_)
+    return coef, y_mean[..., 0] - (x_mean[..., 0, :] * coef).sum(axis=-1)
+
+def batch_iterative(values, targets, masks, max_iter=10, tol=1.e-3):
+    #As IterativeImputer(random_state=0): mean start, then rounds of BayesianRidge
+    #predictions over the targets (equal missing fractions, so in column order)
+    #until the change is below tol * max|observed|. The models are fit only once.
+    batch, n = masks.shape
+    coef, intercept = _fit_models(values, targets, masks, _bayesian_ridge)
+    observed = np.broadcast_to(~masks[:, :, None], (batch, n, values.shape[1])).copy()
+    observed[:, :, [c for c in range(values.shape[1]) if c not in targets]] = True
+    imputed = np.where(observed, values, batch_mean(values, observed))
+    normalized_tol = tol * np.abs(np.where(observed, values, 0)).max(axis=(1,2))
+    miss = np.nonzero(masks)[1].reshape(batch, -1)
+    rows = np.arange(batch)[:, None]
+    active = np.ones(batch, dtype=bool)
+    previous = imputed.copy()
+    for _ in range(max_iter):
+        for t, col in enumerate(targets):
+            x = np.delete(imputed[rows, miss], col, axis=2)
+            predicted = (x @ coef[:, t, :, None])[..., 0] + intercept[:, t, None]
+            imputed[rows, miss, col] = np.where(active[:, None], predicted, imputed[rows, miss, col])
+        active &= np.abs(imputed - previous).sum(axis=2).max(axis=1) >= normalized_tol
+        if not active.any():
+            break
+        previous = imputed.copy()
+    return imputed
+
+def batch_mice(values, targets, masks, seeds):
+    #As impyute's mice: mean placeholders, then a randomly chosen column is
+    #re-predicted at a time until every imputed value moves less than 10%.
+    #The linear regressions are fit once per mask and column; the random column
+    #sequence follows np.random.seed(seed) as in sleep_iteration/ema_iteration.
+    batch, n = masks.shape
+    coef, intercept = _fit_models(values, targets, masks, _linear_regression)
+    observed = ~masks[:, :, None] | ~np.isin(np.arange(values.shape[1]), targets)
+    start = np.where(observed, values, batch_mean(values, observed))
+    imputed = np.empty((batch,) + values.shape)
+    for b in range(batch):
+        data = start[b].copy()
+        miss = np.flatnonzero(masks[b])
+        converged = np.zeros((len(miss), len(targets)), dtype=bool)
+        state = np.random.RandomState(seeds[b])
+        while not converged.all():
+            t = targets.index(int(state.choice(list(set(targets)))))
+            col = targets[t]
+            value = data[miss, col]
+            new_value = np.delete(data[miss], col, axis=1) @ coef[b, t] + intercept[b, t]
+            data[miss, col] = new_value
+            delta = (new_value - value) / np.where(value == 0.0, 0.01, value)
+            converged[:, t] = np.abs(delta) < 0.1
+        imputed[b] = data
+    return imputed
+
+_distances = {}
+def _knn_distances(table, targets):
+    #The distances only depend on the data, so a worker computes them once
+    key = (table.tobytes(), tuple(targets))
+    if key not in _distances:
+        _distances[key] = knn_distances(table, [c for c in range(table.shape[1]) if c not in targets])
+    return _distances[key]
+
+def batch_mse(truth, imputed, masks):
+    err = np.where(masks[:, :, None], truth - imputed, 0)
+    return (err**2).sum(axis=(1,2)) / (masks.sum(axis=1) * truth.shape[1])
+
+def sleep_batch(pilot, gold, methods=batch_methods, seed=0, start=0, stop=0):
+    ''' MSE per imputer of iterations start..stop-1 of the sleep benchmark.
+    '''
+    values = pilot[sleep_cols].values.astype(float)
+    table = pilot.values.astype(float)
+    targets = [pilot.columns.get_loc(col) for col in sleep_cols]
+    masks, seeds = missing_masks(len(pilot), seed, start, stop)
+    observed = ~masks[:, :, None] & ~np.isnan(values)
+    batch_imputers = {'mean': lambda: batch_mean(values, observed),
+                      'common': lambda: batch_mode(values, observed),
+                      'zero': lambda: batch_zero(values, observed),
+                      'linear': lambda: batch_linear(pilot[activity_cols].values.astype(float), values, masks),
+                      'knn': lambda: batch_knn(_knn_distances(table, targets), values, observed, masks),
+                      'iterative': lambda: batch_iterative(table, targets, masks)[:, :, targets],
+                      'interpolation': lambda: batch_interpolation(values, observed),
+                      'imice': lambda: batch_mice(table, targets, masks, seeds)[:, :, targets]}
+    truth = gold[sleep_cols].values
+    return {key: batch_mse(truth, batch_imputers[key](), masks) for key in methods}
+
+def ema_batch(pilot, gold, methods=[m for m in batch_methods if m in ema_methods], seed=0, start=0, stop=0):
+    ''' MSE per imputer of iterations start..stop-1 of the EMA benchmark.
+    '''
+    values = pilot.values.astype(float)
+    targets = list(range(values.shape[1]))
+    masks, seeds = missing_masks(len(pilot), seed, start, stop)
+    observed = ~masks[:, :, None] & ~np.isnan(values)
+    batch_imputers = {'mean': lambda: batch_mean(values, observed),
+                      'common': lambda: batch_mode(values, observed),
+                      'zero': lambda: batch_zero(values, observed),
+                      'knn': lambda: batch_knn(None, values, observed, masks),
+                      'iterative': lambda: batch_iterative(values, targets, masks),
+                      'interpolation': lambda: batch_interpolation(values, observed),
+                      'imice': lambda: batch_mice(values, targets, masks, seeds)}
+    truth = gold.values
+    return {key: batch_mse(truth, batch_imputers[key](), masks) for key in methods}
@@ -0,0 +1,239 @@
+###############################################################################
+# Parallel Monte Carlo engine for the imputation benchmark                    #
+#                                                                             #
+# Iterations are split in blocks and fanned out over a process pool. Every    #
+# iteration i draws from its own generator, seeded with SeedSequence(seed,    #
+# spawn_key=(i,)), so the results are bit-identical no matter how many        #
+# workers (or which block size) are used.                                     #
+#                                                                             #
+# With batched=True, func gets a whole block at once (seed, start, stop) and  #
+# returns arrays, see imputers.sleep_batch.                                   #
+#                                                                             #
+# run_to_store() streams the blocks to disk instead of keeping them in        #
+# memory (one raw float64 column per method plus a progress file), keeps      #
+# online summaries, and resumes from the last block that was written. The     #
+# progress file holds a fingerprint of the inputs (the args, the name of func #
+# and the source of its module), and a run whose inputs changed starts over.  #
+###############################################################################
+
+import os
+import sys
+import json
+import time
+import hashlib
+import inspect
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from threadpoolctl import threadpool_limits
+
+_task = None
+
+def iteration_rng(seed, i):
+    ''' Independent random stream of iteration i.
+    '''
+    return np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(i,)))
+
+def _init_worker(func, args):
+    global _task
+    _task = (func, args)
+    #One BLAS thread per process, otherwise n workers fight for n*n threads
+    threadpool_limits(limits=1)
+
+def _run_block(start, stop, seed, batched=False):
+    func, args = _task
+    if batched:
+        return start, func(*args, seed=seed, start=start, stop=stop)
+    results = {}
+    for i in range(start, stop):
+        for key, value in func(*args, rng=iteration_rng(seed, i)).items():
+            results.setdefault(key, []).append(value)
+    return start, {key: np.asarray(value) for key, value in results.items()}
+
+def iterate_blocks(func, args, iterations, seed=0, workers=None, block_size=100, start=0, batched=False, name='montecarlo'):
+    ''' Run func(*args, rng=...) for iterations start..iterations-1.
+
+    Yields (first_iteration, {key: array}) per block, in iteration order, and
+    prints the throughput as blocks come in. func must return a dict of floats
+    (or, if batched, a dict of arrays for the block) and, like args, be
+    picklable (i.e. defined in an importable module).
+    '''
+    global _task
+    workers = workers or os.cpu_count()
+    blocks = [(b, min(b + block_size, iterations)) for b in range(start, iterations, block_size)]
+    tic = time.perf_counter()
+    done = 0
+    if workers == 1:
+        _task = (func, args)
+        results = (_run_block(b, e, seed, batched) for b, e in blocks)
+        pool = None
+    else:
+        pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(func, args))
+        results = pool.map(_run_block, *zip(*blocks), [seed]*len(blocks), [batched]*len(blocks)) if blocks else iter(())
+    try:
+        for first, block in results:
+            done += len(next(iter(block.values())))
+            elapsed = time.perf_counter() - tic
+            print(f'{name}: {start+done}/{iterations} iterations, {done/elapsed:.1f} it/s')
+            yield first, block
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+
+def run(func, args, iterations, seed=0, workers=None, block_size=100, batched=False, name='montecarlo'):
+    ''' Collect all iterations of func in a {key: array} dict.
+    '''
+    results = {}
+    for _, block in iterate_blocks(func, args, iterations, seed=seed, workers=workers, block_size=block_size, batched=batched, name=name):
+        for key, value in block.items():
+            results.setdefault(key, []).append(value)
+    return {key: np.concatenate(value) for key, value in results.items()}
+
+######################### Streaming results ##################################
+def _feed(h, value):
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        h.update(repr((type(value).__name__, value.shape, list(value.index.names))).encode())
+        if isinstance(value, pd.DataFrame):
+            h.update(repr(list(value.columns)).encode())
+        h.update(pd.util.hash_pandas_object(value, index=True).values.tobytes())
+    elif isinstance(value, np.ndarray):
+        h.update(repr((value.dtype.str, value.shape)).encode())
+        h.update(np.ascontiguousarray(value).tobytes())
+    elif isinstance(value, (list, tuple)):
+        h.update(repr((type(value).__name__, len(value))).encode())
+        for item in value:
+            _feed(h, item)
+    else:
+        h.update(repr(value).encode())
+
+def fingerprint(func, args):
+    ''' Hash of what a run computes: the args (tables hashed by value), the
+    name of func and the source of the module that defines it.
+    '''
+    h = hashlib.sha1()
+    h.update(f'{func.__module__}.{func.__qualname__}'.encode())
+    h.update(inspect.getsource(sys.modules[func.__module__]).encode())
+    _feed(h, args)
+    return h.hexdigest()
+
+class OnlineStats:
+    ''' Running count, mean and variance (Chan et al. merge) of a series, and
+    quantiles from a log-binned histogram (~1% relative resolution between
+    1e-8 and 1e12; values below go to the first bin). Meant for MSEs.
+    '''
+    edges = np.logspace(-8, 12, 20*230 + 1)
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.
+        self.m2 = 0.
+        self.hist = np.zeros(len(self.edges) + 1, dtype=np.int64)
+
+    def update(self, values):
+        values = np.asarray(values, dtype=float)
+        if values.size == 0:
+            return
+        count, mean = values.size, values.mean()
+        delta = mean - self.mean
+        total = self.count + count
+        self.m2 += ((values - mean)**2).sum() + delta**2 * self.count * count / total
+        self.mean += delta * count / total
+        self.count = total
+        self.hist += np.bincount(np.searchsorted(self.edges, values, side='right'), minlength=len(self.hist))
+
+    @property
+    def variance(self):
+        return self.m2 / (self.count - 1) if self.count > 1 else np.nan
+
+    def quantile(self, q):
+        #linear interpolation inside the bin (log-linear would not matter at 1%)
+        cum = np.cumsum(self.hist)
+        target = q * self.count
+        b = np.searchsorted(cum, target, side='left')
+        lo = self.edges[b-1] if b > 0 else 0.
+        hi = self.edges[min(b, len(self.edges)-1)]
+        below = cum[b-1] if b > 0 else 0
+        return lo + (hi - lo) * (target - below) / max(self.hist[b], 1)
+
+class ResultStore:
+    ''' Results of a benchmark run on disk, in path: one raw float64 file per
+    key (<key>.f8, readable with np.memmap) and progress.json, which is only
+    rewritten (atomically) after a block is fully flushed. Reopening a store
+    drops anything written after the last completed block and rebuilds the
+    online statistics from the columns; if fingerprint (see fingerprint())
+    differs from the one of the stored run, the run starts over.
+    '''
+    quantiles = [0.05, 0.25, 0.5, 0.75, 0.95]
+
+    def __init__(self, path, keys, seed, fingerprint=None):
+        self.path = path
+        self.keys = list(keys)
+        self.seed = seed
+        self.fingerprint = fingerprint
+        self.done = 0
+        os.makedirs(path, exist_ok=True)
+        progress = os.path.join(path, 'progress.json')
+        if os.path.exists(progress):
+            with open(progress) as f:
+                meta = json.load(f)
+            if meta['keys'] != self.keys or meta['seed'] != seed:
+                raise ValueError(f'{path} holds a run with keys {meta["keys"]} and seed {meta["seed"]}, '
+                                 f'not {self.keys} and {seed}; remove it or use another path')
+            if meta.get('fingerprint') == fingerprint:
+                self.done = meta['done']
+            else:
+                print(f'{path}: the data or code changed since the stored run, starting over')
+        self.stats = {key: OnlineStats() for key in self.keys}
+        for key in self.keys:
+            with open(self._column(key), 'ab') as f:
+                f.truncate(8*self.done)
+            column = self.load(key)
+            for b in range(0, self.done, 1000000):
+                self.stats[key].update(column[b:b+1000000])
+
+    def _column(self, key):
+        return os.path.join(self.path, f'{key}.f8')
+
+    def append(self, block):
+        for key in self.keys:
+            values = np.asarray(block[key], dtype='<f8')
+            with open(self._column(key), 'ab') as f:
+                f.write(values.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            self.stats[key].update(values)
+        self.done += len(values)
+        tmp = os.path.join(self.path, 'progress.json.tmp')
+        with open(tmp, 'w') as f:
+            json.dump({'keys': self.keys, 'seed': self.seed, 'fingerprint': self.fingerprint,
+                       'done': self.done}, f)
+        os.replace(tmp, os.path.join(self.path, 'progress.json'))
+
+    def load(self, key, count=None):
+        ''' Memory-mapped column of key (the first count iterations).
+        '''
+        count = self.done if count is None else min(count, self.done)
+        if count == 0:
+            return np.zeros(0)
+        return np.memmap(self._column(key), dtype='<f8', mode='r', shape=(count,))
+
+    def summary(self):
+        rows = {}
+        for key, stats in self.stats.items():
+            rows[key] = {'count': stats.count, 'mean': stats.mean, 'var': stats.variance}
+            rows[key].update({f'q{round(100*q):02d}': stats.quantile(q) for q in self.quantiles})
+        return pd.DataFrame.from_dict(rows, orient='index')
+
+def run_to_store(func, args, iterations, path, keys, seed=0, workers=None, block_size=100, batched=False, name='montecarlo'):
+    ''' As run(), but every block is flushed to a ResultStore in path as it comes
+    in, and an interrupted run continues from the last block on disk (unless
+    args or the module of func changed). keys are the names func returns.
+    The summary is written to path/summary.csv.
+    '''
+    store = ResultStore(path, keys, seed, fingerprint(func, args))
+    for _, block in iterate_blocks(func, args, iterations, seed=seed, workers=workers, block_size=block_size,
+                                   start=store.done, batched=batched, name=name):
+        store.append(block)
+        store.summary().to_csv(os.path.join(path, 'summary.csv'))
+    return store
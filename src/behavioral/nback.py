@@ -0,0 +1,229 @@
+###############################################################################
+# Dual n-back logs (pilot_ii) shared by the behavioral scripts                #
+#                                                                             #
+# read_rawdata() streams a *_OnlyNovels_fMRI_rawdata.txt line by line. Every  #
+# 'Block type:' line starts a block (VV1, DD1, ...), the next line is its     #
+# header and the tab-separated rows up to the blank line are its trials.      #
+###############################################################################
+
+import os
+import re
+import sys
+import json
+import hashlib
+import inspect
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+from scipy.stats import norm
+
+def _column_names(header, width):
+    #the header repeats 'whichtask' and some rows carry more fields than it names
+    names, seen = [], {}
+    for name in header:
+        seen[name] = seen.get(name, 0) + 1
+        names.append(name if seen[name] == 1 else f'{name}_{seen[name]}')
+    return names + [f'col{i}' for i in range(len(names), width)]
+
+def _trial_frame(labels, header, rows):
+    width = max([len(header)] + [len(row) for row in rows])
+    values = np.full((len(rows), width), np.nan)
+    for i, row in enumerate(rows):
+        values[i, :len(row)] = row
+    #columns of whole numbers (without gaps) come back as integers
+    whole = ~np.isnan(values).any(axis=0) & (values == np.round(values)).all(axis=0)
+    columns = {'block': np.array(labels, dtype=object)}
+    for j, name in enumerate(_column_names(header, width)):
+        columns[name] = values[:, j].astype(np.int64) if whole[j] else values[:, j]
+    return pd.DataFrame(columns)
+
+def read_rawdata(file):
+    ''' All the blocks of a raw n-back log as one numeric trial table, in file
+    order, with the block type in the 'block' column. Header names are
+    stripped of spaces; a repeated name gets a _2 suffix and unnamed fields
+    are called col<position>.
+    '''
+    blocks = [] #(block type, header, rows)
+    with open(file) as f:
+        for line in f:
+            fields = line.rstrip('\r\n').split('\t')
+            if fields[0] == 'Block type:':
+                blocks.append((fields[1].strip(), None, []))
+            elif not blocks:
+                continue
+            elif blocks[-1][1] is None:
+                blocks[-1] = (blocks[-1][0], [name.strip() for name in fields], blocks[-1][2])
+            elif fields[0].strip():
+                blocks[-1][2].append([float(field) for field in fields])
+    if all(header == blocks[0][1] for _, header, _ in blocks):
+        labels = [block for block, _, rows in blocks for _ in rows]
+        return _trial_frame(labels, blocks[0][1], [row for _, _, rows in blocks for row in rows])
+    return pd.concat([_trial_frame([block]*len(rows), header, rows) for block, header, rows in blocks],
+                     ignore_index=True)
+
+############################# Summary files ###################################
+# scan() lists the pilot folder once and tags every log with its day, n-back  #
+# level and kind. read_thresholds() pulls the auditory and visual threshold   #
+# of every block with one precompiled pattern; thresholds() does it for all   #
+# the summaries in a thread pool and caches the tidy table in the folder.     #
+###############################################################################
+
+_log_name = re.compile(r'^day(\d+)_(?:(\d+)back_)?OnlyNovels_fMRI_(rawdata|summary)\.txt$')
+#the first threshold of a block is the auditory one, the second the visual one;
+#neither may be taken from the next block
+_block_thresholds = re.compile(r'Block type:\s*(\S+)'
+                               r'(?:(?!Block type:).)*?threshold:\s*([\d\.]+)'
+                               r'(?:(?!Block type:).)*?threshold:\s*([\d\.]+)', re.DOTALL)
+
+def scan(path):
+    ''' Table of the n-back logs in path (file, day, level, kind), sorted by
+    day and level; files without a level in their name are 1-back.
+    '''
+    logs = []
+    for file in os.listdir(os.path.abspath(path)):
+        match = _log_name.match(file)
+        if match:
+            day, level, kind = match.groups()
+            logs.append((file, int(day), int(level or 1), kind))
+    logs = pd.DataFrame(logs, columns=['file', 'day', 'level', 'kind'])
+    return logs.sort_values(['day', 'level', 'kind'], ignore_index=True)
+
+def read_thresholds(file):
+    ''' [(block, modality, threshold)] of a summary file, in file order. '''
+    with open(file, 'r') as f:
+        text = f.read()
+    rows = []
+    for block, auditory, visual in _block_thresholds.findall(text):
+        rows += [(block, 'auditory', float(auditory)), (block, 'visual', float(visual))]
+    return rows
+
+def _source_stamp(path, files):
+    #the logs as they are on disk and the code that parses them (this module)
+    stats = [os.stat(os.path.join(path, file)) for file in files]
+    code = hashlib.sha1(inspect.getsource(sys.modules[__name__]).encode()).hexdigest()
+    return json.dumps({'code': code, 'files': {file: [s.st_size, s.st_mtime_ns] for file, s in zip(files, stats)}})
+
+def _cached(path, name, files, build, cache=True):
+    ''' build() (a DataFrame), kept in path/.nback_cache/<name>.npz with one
+    array per column and rebuilt only when one of files is added, removed or
+    changed, or when this module (the parsing code) changes.
+    '''
+    store = os.path.join(os.path.abspath(path), '.nback_cache', f'{name}.npz')
+    stamp = _source_stamp(path, files)
+    if cache and os.path.exists(store):
+        with np.load(store) as arrays:
+            if str(arrays['source']) == stamp:
+                return pd.DataFrame({key: arrays[key] for key in arrays.files if key != 'source'})
+    table = build()
+    if cache:
+        os.makedirs(os.path.dirname(store), exist_ok=True)
+        tmp = store + '.tmp.npz'
+        np.savez(tmp, source=stamp, **{col: table[col].values.astype(str) if table[col].dtype == object else table[col].values
+                                      for col in table.columns})
+        os.replace(tmp, store)
+    return table
+
+def thresholds(path, workers=8, cache=True):
+    ''' Tidy table (day, level, block, modality, threshold) of every summary
+    file in path, cached in path/.nback_cache/thresholds.npz.
+    '''
+    logs = scan(path)
+    logs = logs[logs['kind'] == 'summary']
+
+    def build():
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            rows = pool.map(read_thresholds, [os.path.join(path, file) for file in logs['file']])
+        return pd.DataFrame([(day, level) + row for day, level, found in zip(logs['day'], logs['level'], rows)
+                             for row in found], columns=['day', 'level', 'block', 'modality', 'threshold'])
+    return _cached(path, 'thresholds', logs['file'], build, cache)
+
+############################### Trial store ###################################
+# trials() keeps every trial of every raw log of the folder in one columnar   #
+# table (day, level, block and the log columns). The signal-detection and     #
+# outcome tables below are computed from it with one groupby per table.       #
+#                                                                             #
+# In the logs, whichtask 1-3 marks a pitch (auditory) change and 4-6 an       #
+# orientation (visual) change; responses 1-2 answer an auditory change and    #
+# 3-4 a visual one, 0 is no answer (in the dual blocks only: in the single-   #
+# modality ones all the answers use the keys of the block). change_correct is #
+# 1 (correct), 0 (wrong) or 5 (missed).                                       #
+###############################################################################
+
+modalities = {'auditory': ([1, 2, 3], [1, 2]), 'visual': ([4, 5, 6], [3, 4])} #whichtask, response codes
+dual_blocks = ['DD1'] #the blocks where both modalities are answered, each with its keys
+outcomes = {1: 'correct', 0: 'wrong', 5: 'missing'} #change_correct codes
+
+def trials(path, workers=8, cache=True):
+    ''' Every trial of the raw logs in path with its day, level and block,
+    cached in path/.nback_cache/trials.npz.
+    '''
+    logs = scan(path)
+    logs = logs[logs['kind'] == 'rawdata']
+
+    def build():
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            tables = list(pool.map(read_rawdata, [os.path.join(path, file) for file in logs['file']]))
+        table = pd.concat(tables, ignore_index=True)
+        table.insert(0, 'level', np.repeat(logs['level'].values, [len(t) for t in tables]))
+        table.insert(0, 'day', np.repeat(logs['day'].values, [len(t) for t in tables]))
+        return table
+    return _cached(path, 'trials', logs['file'], build, cache)
+
+def outcome_counts(trials, by=['day', 'level', 'block']):
+    ''' Number of correct, wrong and missing trials per session (0 when there
+    are none).
+    '''
+    counts = pd.crosstab([trials[col] for col in by], trials['change_correct'])
+    return counts.reindex(columns=list(outcomes), fill_value=0).rename(columns=outcomes).rename_axis(columns=None)
+
+def detection(trials, by=['day', 'level', 'block']):
+    ''' Signal-detection table per session and modality: hit and false-alarm
+    rates, d' and criterion c, and the mean and median reaction time of the
+    hits. A hit is a change of the modality answered with its keys, a false
+    alarm a change of the other modality answered with them. d' and c use the
+    log-linear correction ((count + .5) / (trials + 1)) so that rates of 0 or 1
+    stay finite. This split only holds in the dual blocks (dual_blocks): in
+    the single-modality ones (VV1, AA1, ...) every trial is answered with the
+    keys of the block, so they get one row (modality 'single') with the
+    share of correct trials (change_correct; nan for blocks that do not code
+    it) as accuracy, the reaction times of the correct trials and nan for the
+    signal-detection columns. The
+    first n trials of a block (nothing to compare with yet) are left out.
+    '''
+    trials = trials[trials['trial'].values > trials['level'].values]
+    dual = trials['block'].isin(dual_blocks).values
+    frames = []
+    for modality, (changes, keys) in modalities.items():
+        signal = trials['whichtask'].isin(changes).values
+        noise = trials['whichtask'].isin([code for other, (codes, _) in modalities.items() if other != modality
+                                          for code in codes]).values
+        answered = trials['response'].isin(keys).values
+        hit = signal & answered
+        frames.append(pd.DataFrame({**{col: trials[col].values[dual] for col in by}, 'modality': modality,
+                                    'signal': signal[dual], 'noise': noise[dual], 'hits': hit[dual],
+                                    'false_alarms': (noise & answered)[dual], 'correct': np.nan,
+                                    'hit_rt': np.where(hit, trials['reaction_time'].values, np.nan)[dual]}))
+    #blocks that do not code change_correct as in outcomes (CC1, PP1) get no accuracy
+    coded = trials['change_correct'].isin(list(outcomes)).groupby(trials['block']).transform('all').values
+    correct = np.where(coded, trials['change_correct'].values == 1, np.nan)
+    frames.append(pd.DataFrame({**{col: trials[col].values[~dual] for col in by}, 'modality': 'single',
+                                'signal': False, 'noise': False, 'hits': False, 'false_alarms': False,
+                                'correct': correct[~dual],
+                                'hit_rt': np.where(correct == 1, trials['reaction_time'].values, np.nan)[~dual]}))
+    groups = pd.concat(frames, ignore_index=True).groupby(by + ['modality'], sort=True)
+    table = groups.agg(signal=('signal', 'sum'), noise=('noise', 'sum'), hits=('hits', 'sum'),
+                       false_alarms=('false_alarms', 'sum'), accuracy=('correct', 'mean'),
+                       rt_mean=('hit_rt', 'mean'), rt_median=('hit_rt', 'median'))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        table['hit_rate'] = table['hits'] / table['signal']
+        table['fa_rate'] = table['false_alarms'] / table['noise']
+        z_hit = norm.ppf((table['hits'] + .5) / (table['signal'] + 1))
+        z_fa = norm.ppf((table['false_alarms'] + .5) / (table['noise'] + 1))
+    valid = (table['signal'] > 0) & (table['noise'] > 0)
+    table['d_prime'] = np.where(valid, z_hit - z_fa, np.nan)
+    table['criterion'] = np.where(valid, -(z_hit + z_fa) / 2, np.nan)
+    table.loc[table['noise'] == 0, 'fa_rate'] = np.nan
+    single = table.index.get_level_values('modality') == 'single'
+    table.loc[single, ['signal', 'noise', 'hits', 'false_alarms', 'hit_rate']] = np.nan
+    return table
@@ -0,0 +1,97 @@
+###############################################################################
+# Bootstrap stability of the PCA contributors (01_feature-selection.py)       #
+#                                                                             #
+# The days are resampled with replacement, every resample is standardized     #
+# and its PCA refitted, and we count how often each feature is among the top  #
+# contributors (largest |loading|) of each component. Resamples run in blocks #
+# on the montecarlo process pool, with one random stream per resample, so     #
+# the frequencies do not depend on the number of workers.                     #
+#                                                                             #
+# The default solver eigendecomposes the p x p correlation matrices of a      #
+# whole block at once; solver='randomized' refits sklearn's randomized PCA    #
+# per resample instead. Components of a resample are matched to those of the  #
+# full data by |cosine| (they can swap order between resamples).              #
+###############################################################################
+
+import numpy as np
+import pandas as pd
+from scipy.optimize import linear_sum_assignment
+from sklearn.decomposition import PCA
+
+import montecarlo
+
+def top_contributors(components, num):
+    ''' Indices of the num largest |loadings| of every component, largest first.
+    '''
+    pcs = np.abs(np.atleast_2d(components))
+    ind = np.argpartition(pcs, -num, axis=1)[:, -num:]
+    order = np.argsort(np.take_along_axis(pcs, ind, axis=1), axis=1)[:, ::-1]
+    return np.take_along_axis(ind, order, axis=1)
+
+def _standardize(data):
+    #as StandardScaler: population std, constant columns left at 0
+    std = data.std(axis=-2, keepdims=True)
+    return (data - data.mean(axis=-2, keepdims=True)) / np.where(std > 0, std, 1.)
+
+def _components(data, n_components):
+    ''' Leading eigenvectors (rows, by decreasing variance) of the
+    standardized data, for a stack of k x n x p tables.
+    '''
+    z = _standardize(data)
+    cov = np.einsum('kni,knj->kij', z, z) / (z.shape[1] - 1)
+    _, vectors = np.linalg.eigh(cov)
+    vectors = vectors[:, :, ::-1]
+    return np.transpose(vectors[:, :, :n_components], (0, 2, 1))
+
+def _match(reference, components):
+    #order the components of a resample like the reference ones
+    _, col = linear_sum_assignment(-np.abs(reference @ components.T))
+    return col
+
+def bootstrap_block(data, n_components, top, solver, seed, start, stop):
+    ''' Resamples start..stop-1: whether each feature is a top contributor of
+    each component (k x components x features) and the loadings |l|.
+    '''
+    reference = _components(data[None], n_components)
+    n = len(data)
+    rngs = [montecarlo.iteration_rng(seed, i) for i in range(start, stop)]
+    rows = np.stack([rng.integers(0, n, n) for rng in rngs])
+    if solver == 'covariance':
+        components = _components(data[rows], n_components)
+    elif solver == 'randomized':
+        #the PCA seed is the next draw of the resample's own stream
+        fits = [PCA(n_components=n_components, svd_solver='randomized', random_state=int(rng.integers(2**31 - 1)))
+                .fit(_standardize(data[rows[j]])) for j, rng in enumerate(rngs)]
+        components = np.stack([fit.components_ for fit in fits])
+    else:
+        raise ValueError(f'unknown solver {solver}')
+    order = np.stack([_match(reference[0], c) for c in components])
+    components = np.take_along_axis(components, order[:, :, None], axis=1)
+    ranks = np.stack([top_contributors(c, top) for c in components])
+    is_top = np.zeros(components.shape, dtype=bool)
+    np.put_along_axis(is_top, ranks, True, axis=2)
+    return {'top': is_top, 'loading': np.abs(components)}
+
+def contributor_stability(data, n_components, top=4, iterations=2000, seed=0, workers=None,
+                          block_size=250, solver='covariance'):
+    ''' Ranked top-contributor frequencies over bootstrap resamples of the rows
+    (days) of data: one row per component and feature with the share of
+    resamples where the feature is among the top contributors, its mean
+    |loading| and whether it is a top contributor on the full data, sorted by
+    frequency within each component. Rows with nan are dropped first.
+    '''
+    data = pd.DataFrame(data).dropna(axis=0)
+    values = data.values.astype(float)
+    results = montecarlo.run(bootstrap_block, (values, n_components, top, solver), iterations, seed=seed,
+                             workers=workers, block_size=block_size, batched=True, name='bootstrap PCA')
+    reference = _components(values[None], n_components)
+    full = np.zeros(reference.shape[1:], dtype=bool)
+    np.put_along_axis(full, top_contributors(reference[0], top), True, axis=1)
+    table = pd.DataFrame({'component': np.repeat([f'PC{c+1}' for c in range(n_components)], data.shape[1]),
+                          'feature': np.tile(data.columns, n_components),
+                          'frequency': results['top'].mean(axis=0).ravel(),
+                          'mean_loading': results['loading'].mean(axis=0).ravel(),
+                          'full_data': full.ravel()})
+    table = table.sort_values(['component', 'frequency', 'mean_loading'], ascending=[True, False, False])
+    table['rank'] = table.groupby('component').cumcount() + 1
+    return table.set_index(['component', 'rank'])
@@ -0,0 +1,122 @@
+###############################################################################
+# PVT (psychomotor vigilance task) scores shared by the behavioral scripts    #
+#                                                                             #
+# All the session logs (dayNN_pvt_log.txt) are read into one frame tagged     #
+# with a session key, and every score is computed for all the sessions in a   #
+# single groupby instead of one set of masks per file.                        #
+###############################################################################
+
+import os
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+scores = ['mean_1_RT', 'median', 'slow_1_RT', 'fast', 'no_lapse_false', 'lapse_prob', 'performance']
+
+def list_logs(path, suffix='_pvt_log.txt'):
+    files = [file for file in os.listdir(os.path.abspath(path)) if file.endswith(suffix)]
+    files.sort()
+    return files
+
+def session_day(file):
+    ''' Day number of a dayNN_pvt_log.txt file. '''
+    return int(file[-14:-12])
+
+def read_logs(path, files=None, key=session_day):
+    ''' All the logs in path (or the given files) in one frame with the log
+    columns (Time, RT, Category) and a 'session' column, key(file).
+    '''
+    files = list_logs(path) if files is None else files
+    logs = [pd.read_csv(os.path.join(path, file), sep="\t", header=[0]) for file in files]
+    data = pd.concat(logs, ignore_index=True)
+    data['session'] = np.repeat([key(file) for file in files], [len(log) for log in logs])
+    return data
+
+def score(data, by='session'):
+    ''' Scores per session of the concatenated logs, indexed by session:
+    mean 1/RT (1/s), median RT, slowest 10% of 1/RT, fastest 10% of RT, number
+    of lapses (RT > 500 ms) and false starts (RT <= 100 ms or a 'false' trial),
+    probability of a lapse and performance (share of trials that are neither).
+
+    As in the original per-file loop, a 'false' trial with RT <= 100 counts as
+    two false starts and the RT statistics leave out the 'false' trials only.
+    '''
+    rt = data['RT']
+    false = (data['Category'] == 'false').values
+    valid_rt = rt.where(~false)
+    frame = pd.DataFrame({'false': false.astype(int) + (rt <= 100).values,
+                          'lapse': (rt > 500).values,
+                          'RT': valid_rt.values,
+                          '1_RT': (1000/valid_rt).values})
+    groups = frame.groupby(data[by].values, sort=True)
+    stats = groups.agg(no_false=('false', 'sum'), no_lapse=('lapse', 'sum'), trials=('false', 'size'),
+                       median=('RT', 'median'), mean_1_RT=('1_RT', 'mean'))
+    stats['fast'] = groups['RT'].quantile(0.1)
+    stats['slow_1_RT'] = groups['1_RT'].quantile(0.9)
+
+    stats['no_lapse_false'] = stats['no_false'] + stats['no_lapse']
+    stats['performance'] = 1 - stats['no_lapse_false']/stats['trials']
+    stats['lapse_prob'] = stats['no_lapse']/(stats['trials'] - stats['no_false'])
+    return stats[scores].rename_axis(by)
+
+def score_logs(path, files=None):
+    ''' Scores of every log in path, one row per session in day order. '''
+    return score(read_logs(path, files))
+
+############################ Incremental store ################################
+# The scores of every log are kept in an .npz (one array per column) with the #
+# log's file name, size, modification time and sha1. update_store() only     #
+# reads and scores the logs whose content changed since the last run.         #
+###############################################################################
+
+def file_hash(file, blocksize=1 << 20):
+    sha1 = hashlib.sha1()
+    with open(file, 'rb') as f:
+        for block in iter(lambda: f.read(blocksize), b''):
+            sha1.update(block)
+    return sha1.hexdigest()
+
+def load_store(store):
+    ''' Stored scores, one row per log file (empty if there is no store). '''
+    if not os.path.exists(store):
+        return pd.DataFrame(columns=['size', 'mtime_ns', 'sha1', 'session'] + scores, index=pd.Index([], name='file'))
+    with np.load(store) as arrays:
+        data = {key: arrays[key] for key in arrays.files}
+    return pd.DataFrame(data).set_index('log').rename_axis('file')
+
+def save_store(table, store):
+    tmp = store + '.tmp.npz'
+    np.savez(tmp, log=table.index.values.astype(str), #'file' is taken by np.savez
+             **{col: table[col].values.astype(str if col == 'sha1' else np.int64 if col in ('size', 'mtime_ns', 'session') else float)
+                for col in table.columns})
+    os.replace(tmp, store)
+
+def update_store(path, store, files=None):
+    ''' Scores of every log in path (as score_logs), taken from the store at
+    store for the logs that did not change, and scored (then stored) for the
+    new or changed ones. Logs no longer in path are dropped from the store.
+    '''
+    files = list_logs(path) if files is None else files
+    stored = load_store(store)
+    dropped = len(stored.index.difference(files))
+    table = stored.reindex(files)
+    stat = [os.stat(os.path.join(path, file)) for file in files]
+    size = np.array([s.st_size for s in stat])
+    mtime = np.array([s.st_mtime_ns for s in stat])
+    #the size and time decide which logs to hash, the hash which to score again
+    touched = ~((table['size'].values == size) & (table['mtime_ns'].values == mtime))
+    sha1 = table['sha1'].values.copy()
+    sha1[touched] = [file_hash(os.path.join(path, file)) for file in np.array(files)[touched]]
+    stale = touched & (sha1 != table['sha1'].values)
+    if stale.any():
+        changed = list(np.array(files)[stale])
+        print(f'scoring {len(changed)} of {len(files)} PVT logs')
+        new = score(read_logs(path, changed, key=lambda file: file)).loc[changed]
+        table.loc[changed, scores] = new[scores].values
+        table.loc[changed, 'session'] = [session_day(file) for file in changed]
+    table['size'], table['mtime_ns'], table['sha1'] = size, mtime, sha1
+    if touched.any() or dropped:
+        save_store(table, store)
+    table = table.astype({'session': np.int64}).set_index('session').sort_index()
+    return table[scores].astype(float).astype({'no_lapse_false': np.int64})
@@ -0,0 +1,244 @@
+###############################################################################
+# Columnar cache for the AWARE sensor files (sub-01_sensor-*.csv)             #
+#                                                                             #
+# Each CSV is converted once into a folder of .npy files: a sorted int64      #
+# time index (ns since epoch, UTC), one typed array per column (text columns  #
+# as category codes) and a meta.json. The folder is rebuilt only when the     #
+# size or modification time of the CSV changes. load() memory-maps the        #
+# arrays and binary-searches the time index, so only the requested columns    #
+# and time window are read.                                                   #
+#                                                                             #
+# A store is written into a new sibling folder and swapped into place, never  #
+# rewritten in place, so processes building and reading the same CSV at once  #
+# (e.g. figures rendered side by side) do not see truncated arrays: arrays    #
+# already memory-mapped from a replaced store stay valid.                     #
+#                                                                             #
+# Only files with an epoch 'time' column are handled; the Oura export is a    #
+# small daily table and is still read with pd.read_csv.                       #
+#                                                                             #
+# resample() bins a column in chunks of the memory-mapped arrays, with        #
+# running sum and count accumulators per bin, so a stream is never loaded at  #
+# once; resample_csv() does the same from a CSV too large to cache.           #
+###############################################################################
+
+import os
+import json
+import shutil
+import threading
+
+import numpy as np
+import pandas as pd
+
+tz = 'Europe/Helsinki'
+
+def cache_path(csv_path, cache_dir=None):
+    folder, name = os.path.split(os.path.abspath(csv_path))
+    cache_dir = cache_dir or os.path.join(folder, '.sensor_cache')
+    return os.path.join(cache_dir, os.path.splitext(name)[0])
+
+def _source_stamp(csv_path):
+    stat = os.stat(csv_path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+def build(csv_path, cache_dir=None, force=False):
+    ''' Convert csv_path into its cache folder (if stale) and return the folder.
+    '''
+    store = cache_path(csv_path, cache_dir)
+    meta_file = os.path.join(store, 'meta.json')
+    stamp = _source_stamp(csv_path)
+    if not force:
+        try:
+            with open(meta_file) as f:
+                if json.load(f)['source'] == stamp:
+                    return store
+        except FileNotFoundError: #not built yet, or being swapped by another process
+            pass
+
+    data = pd.read_csv(csv_path)
+    if 'time' not in data.columns:
+        raise ValueError(f'{csv_path} has no epoch "time" column')
+    index = pd.to_datetime(data['time'], unit='s').values.view(np.int64)
+    order = np.argsort(index, kind='mergesort') #stable: duplicated times keep the file order
+    tmp = f'{store}.tmp-{os.getpid()}-{threading.get_ident()}'
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    np.save(os.path.join(tmp, 'index.npy'), index[order])
+    columns = {}
+    for i, col in enumerate(data.columns):
+        values = data[col].values[order]
+        if data[col].dtype == object:
+            codes, categories = pd.factorize(values, sort=True)
+            np.save(os.path.join(tmp, f'col{i}.npy'), codes.astype(np.int32))
+            columns[col] = {'file': f'col{i}.npy', 'categories': categories.tolist()}
+        else:
+            np.save(os.path.join(tmp, f'col{i}.npy'), values)
+            columns[col] = {'file': f'col{i}.npy'}
+    with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+        json.dump({'source': stamp, 'rows': len(data), 'columns': columns}, f)
+    _swap(tmp, store)
+    return store
+
+def _swap(tmp, store):
+    #a folder cannot atomically replace a non-empty one: the old store is moved aside first
+    #and removed after (its memory-mapped arrays stay valid). If another process puts its
+    #store in place in between, that one (built from the same CSV) is kept and ours dropped.
+    old = f'{tmp}.old'
+    try:
+        os.rename(store, old)
+    except FileNotFoundError:
+        old = None
+    try:
+        os.rename(tmp, store)
+    except OSError:
+        shutil.rmtree(tmp, ignore_errors=True)
+    if old is not None:
+        shutil.rmtree(old, ignore_errors=True)
+
+def _open(csv_path, columns=None, cache_dir=None, attempts=3):
+    ''' (meta, time index, {column: array}) of the store of csv_path, all
+    memory-mapped from the same store.
+    '''
+    for attempt in range(attempts):
+        store = build(csv_path, cache_dir)
+        try:
+            with open(os.path.join(store, 'meta.json')) as f:
+                meta = json.load(f)
+            index = np.load(os.path.join(store, 'index.npy'), mmap_mode='r')
+            arrays = {col: np.load(os.path.join(store, meta['columns'][col]['file']), mmap_mode='r')
+                      for col in (columns or list(meta['columns']))}
+            return meta, index, arrays
+        except FileNotFoundError:
+            #another process was swapping the store in
+            if attempt == attempts - 1:
+                raise
+
+def _bounds(begin, end):
+    #As .loc[begin:end] on a tz-aware index: a date-only end includes that whole day
+    lo = None if begin is None else pd.Timestamp(begin).tz_localize(tz).value
+    hi, hi_side = None, 'right'
+    if end is not None:
+        stamp = pd.Timestamp(end)
+        if isinstance(end, str) and len(end) <= 10:
+            stamp, hi_side = stamp + pd.Timedelta(days=1), 'left'
+        hi = stamp.tz_localize(tz).value
+    return lo, hi, hi_side
+
+def load(csv_path, columns=None, begin=None, end=None, categorical=True, cache_dir=None):
+    ''' DataFrame of the given columns between begin and end (local time),
+    indexed by the tz-aware 'date' and sorted by time. Text columns come back
+    as pd.Categorical, or as object arrays with categorical=False.
+    '''
+    meta, index, arrays = _open(csv_path, columns, cache_dir)
+    lo, hi, hi_side = _bounds(begin, end)
+    first = 0 if lo is None else np.searchsorted(index, lo, side='left')
+    last = len(index) if hi is None else np.searchsorted(index, hi, side=hi_side)
+
+    data = {}
+    for col, values in arrays.items():
+        info = meta['columns'][col]
+        values = values[first:last]
+        if 'categories' in info:
+            values = pd.Categorical.from_codes(values, categories=info['categories'])
+            if not categorical:
+                values = np.asarray(values, dtype=object)
+        else:
+            values = np.array(values)
+        data[col] = values
+    date = pd.DatetimeIndex(np.array(index[first:last]).view('datetime64[ns]')).tz_localize('UTC').tz_convert(tz)
+    return pd.DataFrame(data, index=date.rename('date'))
+
+def _chunk_times(chunk):
+    return pd.to_datetime(chunk['time'], unit='s').values.view(np.int64)
+
+def _in_window(ns, lo, hi, hi_side):
+    keep = np.ones(len(ns), dtype=bool)
+    if lo is not None:
+        keep &= ns >= lo
+    if hi is not None:
+        keep &= (ns < hi) if hi_side == 'left' else (ns <= hi)
+    return keep
+
+def _bins(first, last, freq):
+    #let pandas place the bins (origin, DST) from the two extreme samples
+    span = pd.DatetimeIndex(np.array([first, last]).view('datetime64[ns]')).tz_localize('UTC').tz_convert(tz)
+    return pd.Series(0, index=span).resample(freq).count().index
+
+def _accumulate(sums, counts, edges, ns, values, transform):
+    values = values.astype(float)
+    if transform is not None:
+        values = transform(values)
+    valid = ~np.isnan(values)
+    idx = np.searchsorted(edges, ns[valid], side='right') - 1
+    sums += np.bincount(idx, weights=values[valid], minlength=len(sums))
+    counts += np.bincount(idx, minlength=len(counts))
+
+def _binned(bins, sums, counts, column):
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.where(counts > 0, sums / counts, np.nan)
+    return pd.DataFrame({column: mean}, index=bins.rename('date'))
+
+def _empty(column):
+    return pd.DataFrame({column: []}, index=pd.DatetimeIndex([], tz=tz, name='date'))
+
+def resample(csv_path, column, freq='1H', begin=None, end=None, transform=None, chunksize=1000000,
+             cache_dir=None, cache_limit=1 << 31):
+    ''' Mean of column per freq bin between begin and end (local time), in
+    chunks; the same frame as
+        load(csv_path, [column], begin, end).resample(freq).mean()
+    but memory only grows with the number of bins. transform, if given, maps
+    each chunk of values (as float) before they are added, e.g. to blank
+    zeros.
+
+    The chunks are read from the memory-mapped cache (built if needed): the
+    time window is a binary search in the sorted index and its first and
+    last samples set the bins. A CSV larger than cache_limit bytes is not
+    cached but read twice in chunks (see resample_csv).
+    '''
+    if os.path.getsize(csv_path) > cache_limit:
+        return resample_csv(csv_path, column, freq, begin, end, transform, chunksize)
+    meta, index, arrays = _open(csv_path, [column], cache_dir)
+    info, values = meta['columns'][column], arrays[column]
+    lo, hi, hi_side = _bounds(begin, end)
+    first = 0 if lo is None else np.searchsorted(index, lo, side='left')
+    last = len(index) if hi is None else np.searchsorted(index, hi, side=hi_side)
+    if first >= last:
+        return _empty(column)
+
+    if 'categories' in info:
+        #text column: numbers stored as text (as pd.to_numeric on the CSV), -1 codes are missing
+        lookup = np.append(pd.to_numeric(pd.Series(info['categories'], dtype=object)).values.astype(float), np.nan)
+    bins = _bins(index[first], index[last - 1], freq)
+    sums = np.zeros(len(bins))
+    counts = np.zeros(len(bins), dtype=np.int64)
+    for start in range(first, last, chunksize):
+        stop = min(start + chunksize, last)
+        chunk = values[start:stop]
+        chunk = lookup[chunk] if 'categories' in info else np.asarray(chunk)
+        _accumulate(sums, counts, bins.asi8, np.asarray(index[start:stop]), chunk, transform)
+    return _binned(bins, sums, counts, column)
+
+def resample_csv(csv_path, column, freq='1H', begin=None, end=None, transform=None, chunksize=1000000):
+    ''' resample() straight from the CSV, for files too large to cache. Rows
+    may be in any order: a first pass over the time column finds the first
+    and last sample, the second adds every chunk to the sum and count of its
+    bin.
+    '''
+    lo, hi, hi_side = _bounds(begin, end)
+    first, last = None, None
+    for chunk in pd.read_csv(csv_path, usecols=['time'], chunksize=chunksize):
+        ns = _chunk_times(chunk)
+        ns = ns[_in_window(ns, lo, hi, hi_side)]
+        if len(ns):
+            first = ns.min() if first is None else min(first, ns.min())
+            last = ns.max() if last is None else max(last, ns.max())
+    if first is None:
+        return _empty(column)
+
+    bins = _bins(first, last, freq)
+    sums = np.zeros(len(bins))
+    counts = np.zeros(len(bins), dtype=np.int64)
+    for chunk in pd.read_csv(csv_path, usecols=['time', column], chunksize=chunksize):
+        ns = _chunk_times(chunk)
+        keep = _in_window(ns, lo, hi, hi_side)
+        _accumulate(sums, counts, bins.asi8, ns[keep], pd.to_numeric(chunk[column]).values[keep], transform)
+    return _binned(bins, sums, counts, column)
@@ -0,0 +1,158 @@
+###############################################################################
+# Stationarity and trend tests for daily behavioral series                    #
+#                                                                             #
+# Every function takes a day x metric table and returns one row of results    #
+# per metric, computed for all the metrics together:                          #
+#   trend()  OLS slope, intercept and R2 against the day, in closed form      #
+#   adf()    augmented Dickey-Fuller test as statsmodels' adfuller (AIC lag   #
+#            selection), the regressions of every metric solved as one stack  #
+#            per lag on the shared lagged-difference design                   #
+# window_trend() gives the slopes and R2 over rolling or expanding windows    #
+# from running sums; rolling() and expanding() run any of them per window.   #
+###############################################################################
+
+import numpy as np
+import pandas as pd
+from statsmodels.tsa.adfvalues import mackinnonp, mackinnoncrit
+
+def _table(data):
+    data = pd.DataFrame(data)
+    return data.values.astype(float), data.columns
+
+def trend(data, x=None):
+    ''' Slope, intercept and R2 (as LinearRegression().score) of every column
+    of data against x (default 1..n days), using the rows where the column
+    is not nan.
+    '''
+    y, columns = _table(data)
+    x = np.arange(1, len(y) + 1, dtype=float) if x is None else np.asarray(x, dtype=float)
+    valid = ~np.isnan(y)
+    n = valid.sum(axis=0)
+    xs = np.where(valid, x[:, None], 0.)
+    ys = np.where(valid, y, 0.)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        x_mean, y_mean = xs.sum(axis=0)/n, ys.sum(axis=0)/n
+        dx = np.where(valid, x[:, None] - x_mean, 0.)
+        dy = np.where(valid, y - y_mean, 0.)
+        sxx, syy, sxy = (dx*dx).sum(axis=0), (dy*dy).sum(axis=0), (dx*dy).sum(axis=0)
+        slope = sxy/sxx
+        #a constant column is fitted perfectly (R2 of 1, as sklearn's r2_score)
+        r2 = np.where(syy > 0, sxy*sxy/(sxx*syy), 1.)
+    return pd.DataFrame({'slope': slope, 'intercept': y_mean - slope*x_mean, 'r2': r2, 'n': n},
+                        index=columns)
+
+def _trend_columns(regression, nobs):
+    t = np.arange(1, nobs + 1, dtype=float)
+    return {'n': [], 'c': [np.ones(nobs)], 'ct': [np.ones(nobs), t],
+            'ctt': [np.ones(nobs), t, t*t]}[regression]
+
+def _ols(y, X):
+    ''' OLS of every y[k] (k x nobs) on its design X[k] (k x nobs x p) as
+    statsmodels does (pinv); returns the t value of the first regressor and
+    the AIC.
+    '''
+    pinv = np.linalg.pinv(X)
+    beta = np.einsum('kpn,kn->kp', pinv, y)
+    resid = y - np.einsum('knp,kp->kn', X, beta)
+    nobs, p = X.shape[1:]
+    ssr = (resid*resid).sum(axis=1)
+    cov00 = (pinv[:, 0, :]**2).sum(axis=1) #[pinv pinv']_00 = inv(X'X)_00
+    tvalue = beta[:, 0]/np.sqrt(ssr/(nobs - p)*cov00)
+    aic = nobs*(np.log(2*np.pi) + np.log(ssr/nobs) + 1) + 2*p
+    return tvalue, aic
+
+def _adf_design(x, lag, nobs, regression):
+    ''' Design of the last nobs differences of every series in x (k x n):
+    level, deterministic terms, then the first lag lagged differences.
+    '''
+    xdiff = np.diff(x, axis=1)
+    n = x.shape[1]
+    level = x[:, n - nobs - 1:n - 1]
+    lags = [xdiff[:, n - 1 - nobs - i:n - 1 - i] for i in range(1, lag + 1)]
+    trends = [np.broadcast_to(col, level.shape) for col in _trend_columns(regression, nobs)]
+    return xdiff[:, -nobs:], np.stack([level] + trends + lags, axis=2)
+
+def adf(data, maxlag=None, regression='c', autolag='AIC'):
+    ''' Augmented Dickey-Fuller test of every column of data, with the results
+    of statsmodels' adfuller(column, maxlag, regression, autolag) as columns:
+    adf, pvalue, usedlag, nobs, 1%, 5%, 10% and icbest. Only autolag='AIC'
+    or None is handled. Columns with nan or constant values get nan.
+    '''
+    y, columns = _table(data)
+    results = pd.DataFrame(np.nan, index=columns,
+                           columns=['adf', 'pvalue', 'usedlag', 'nobs', '1%', '5%', '10%', 'icbest'])
+    ok = ~np.isnan(y).any(axis=0) & (np.nanmax(y, axis=0) > np.nanmin(y, axis=0))
+    x = y[:, ok].T
+    n = y.shape[0]
+    ntrend = len(_trend_columns(regression, 0))
+    if maxlag is None:
+        maxlag = min(n // 2 - ntrend - 1, int(np.ceil(12.0 * np.power(n / 100.0, 1 / 4.0))))
+    if maxlag < 0 or maxlag > n // 2 - ntrend - 1:
+        raise ValueError('maxlag must be less than (nobs/2 - 1 - ntrend)')
+
+    if autolag is None:
+        usedlag = np.full(len(x), maxlag)
+        icbest = np.full(len(x), np.nan)
+    elif autolag.lower() == 'aic':
+        #every lag is compared on the same rows, those left by the largest one
+        nobs = n - 1 - maxlag
+        xdshort, design = _adf_design(x, maxlag, nobs, regression)
+        aic = np.stack([_ols(xdshort, design[:, :, :1 + ntrend + lag])[1] for lag in range(maxlag + 1)])
+        usedlag = np.argmin(aic, axis=0) #ties go to the shorter lag, as in statsmodels
+        icbest = aic.min(axis=0)
+    else:
+        raise ValueError('only autolag="AIC" or None is supported')
+
+    adfstat = np.empty(len(x))
+    used_nobs = n - 1 - usedlag
+    for lag in np.unique(usedlag):
+        #the columns that share a lag share the shape of their final regression
+        k = usedlag == lag
+        xdshort, design = _adf_design(x[k], lag, n - 1 - lag, regression)
+        adfstat[k] = _ols(xdshort, design)[0]
+
+    results.loc[ok, 'adf'] = adfstat
+    results.loc[ok, 'pvalue'] = [mackinnonp(stat, regression=regression, N=1) for stat in adfstat]
+    results.loc[ok, 'usedlag'] = usedlag
+    results.loc[ok, 'nobs'] = used_nobs
+    results.loc[ok, ['1%', '5%', '10%']] = np.array([mackinnoncrit(N=1, regression=regression, nobs=obs)
+                                                     for obs in used_nobs]).reshape(-1, 3)
+    results.loc[ok, 'icbest'] = icbest
+    return results
+
+def window_trend(data, window=None, min_periods=2, x=None):
+    ''' Slope and R2 of every column against x (default 1..n) over rolling
+    windows of window rows, or expanding windows when window is None, as two
+    day x metric tables labelled by the last day of the window. Computed from
+    running sums, so there is no fit per window; nan values are left out and
+    windows with fewer than min_periods values are nan.
+    '''
+    data = pd.DataFrame(data).astype(float)
+    x = np.arange(1, len(data) + 1, dtype=float) if x is None else np.asarray(x, dtype=float)
+    x = pd.DataFrame(np.repeat(x[:, None], data.shape[1], axis=1), index=data.index, columns=data.columns)
+    x = x.where(data.notna())
+    windows = (lambda frame: frame.expanding(min_periods)) if window is None else \
+              (lambda frame: frame.rolling(window, min_periods=min_periods))
+    n = windows(data).count()
+    sx, sy = windows(x).sum(), windows(data).sum()
+    sxx, syy, sxy = windows(x*x).sum(), windows(data*data).sum(), windows(x*data).sum()
+    vxx, vyy, vxy = sxx - sx*sx/n, syy - sy*sy/n, sxy - sx*sy/n
+    slope = vxy/vxx
+    r2 = (vxy*vxy/(vxx*vyy)).where(vyy > 1e-12*(syy.abs() + 1), 1.).where(slope.notna())
+    return slope, r2
+
+def rolling(func, data, window, **kwargs):
+    ''' func(data over each window of window rows), stacked with the last day
+    of the window as the first index level.
+    '''
+    data = pd.DataFrame(data)
+    return pd.concat({data.index[end - 1]: func(data.iloc[end - window:end], **kwargs)
+                      for end in range(window, len(data) + 1)})
+
+def expanding(func, data, min_periods, **kwargs):
+    ''' func(data up to each day from the min_periods-th one), stacked with
+    that day as the first index level.
+    '''
+    data = pd.DataFrame(data)
+    return pd.concat({data.index[end - 1]: func(data.iloc[:end], **kwargs)
+                      for end in range(min_periods, len(data) + 1)})
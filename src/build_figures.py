@@ -0,0 +1,207 @@
+###############################################################################
+# Builds the Supplementary Figures of the pilots                              #
+#                                                                             #
+#   python src/build_figures.py [figure ...] [--force] [--workers N]          #
+#                                                                             #
+# figures lists the script, inputs and outputs of every figure. Each one is   #
+# rendered by its script in a process of its own (Agg backend, run from the   #
+# repository root), up to workers at once, so a full rebuild takes about as   #
+# long as the slowest figure. A figure is skipped when the sha1 of its        #
+# script, of the local modules it imports and of its inputs are those of its  #
+# last successful build and its outputs exist. The hashes and the output of   #
+# the scripts are kept in results/.build/.                                    #
+#                                                                             #
+# caches lists the cache folders a figure builds and shares with others;      #
+# figures sharing one are not rendered at the same time, so a cold cache is   #
+# built once and then reused.                                                 #
+###############################################################################
+
+import os
+import sys
+import ast
+import glob
+import json
+import threading
+import time
+import hashlib
+import argparse
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+build_dir = os.path.join(root, 'results', '.build')
+
+figures = {
+    '2': {'script': 'src/behavioral/00_learning_PVT.py',
+          'inputs': ['data/pilot_i/PVT'],
+          'outputs': ['results/pilot_i/SupplementaryFigure2.pdf']},
+    '3': {'script': 'src/behavioral/00_missing_data.py', 'args': ['pilot_i'],
+          'inputs': ['data/pilot_i/behavioral'],
+          'outputs': ['results/pilot_i/SupplementaryFigure3.pdf']},
+    '4': {'script': 'src/behavioral/00_learning_nback.py',
+          'inputs': ['data/pilot_ii'],
+          'outputs': ['results/pilot_ii/SupplementaryFigure4.pdf']},
+    '5': {'script': 'src/fmri/preprocessing/plot_preprocess.py',
+          'inputs': ['data/pilot_iii/fmri/r_brain.nii.gz', 'data/pilot_iii/fmri/r_gs_brain.nii.gz',
+                     'data/pilot_iii/fmri/SF5'],
+          'outputs': ['results/pilot_iii/SupplementaryFigure5.pdf']},
+    '6': {'script': 'src/fmri/quality/plot_tsnr.py',
+          'inputs': ['data/pilot_iii/fmri/tsnr'],
+          'outputs': ['results/pilot_iii/SupplementaryFigure6E.pdf'] +
+                     [f'results/pilot_iii/SupplementaryFigure6_{task}.pdf' for task in ['pvt', 'resting', 'movie', 'nback']] +
+                     ['results/pilot_iii/colorbar_tsnr.pdf']},
+    '7': {'script': 'src/fmri/quality/plot_fd.py',
+          'inputs': ['data/pilot_iii/fmri/*_desc-confounds_timeseries.tsv'],
+          'outputs': ['results/pilot_iii/SupplementaryFigure7.pdf']},
+    '8': {'script': 'src/behavioral/00_missing_data.py', 'args': ['pilot_iii'],
+          'inputs': ['data/pilot_iii/behavioral'],
+          'caches': ['data/pilot_iii/behavioral/.sensor_cache'],
+          'outputs': ['results/pilot_iii/SupplementaryFigure8.pdf']},
+    '9': {'script': 'src/behavioral/01_feature-selection.py',
+          'inputs': ['data/pilot_iii/behavioral/sub-01_sensor-oura.csv'],
+          'outputs': ['results/pilot_iii/SupplementaryFigure9.pdf']},
+    '10': {'script': 'src/behavioral/01_imputation.py',
+           'inputs': ['data/pilot_iii/behavioral/sub-01_sensor-oura.csv',
+                      'data/pilot_iii/behavioral/sub-01_sensor-esm.csv'],
+           'caches': ['data/pilot_iii/behavioral/.sensor_cache'],
+           'outputs': ['results/pilot_iii/SupplementaryFigure10.pdf']},
+    '11-12': {'script': 'src/fmri/analysis/plot_ISC.py',
+              'inputs': ['data/pilot_iii/fmri/ISC'],
+              'outputs': ['results/pilot_iii/SupplementaryFigure11.pdf',
+                          'results/pilot_iii/SupplementaryFigure12.pdf']},
+}
+
+def _files(pattern):
+    #files of a path, folder (hidden folders, i.e. the caches, left out) or glob pattern
+    files = []
+    for path in sorted(glob.glob(os.path.join(root, pattern))):
+        if os.path.isdir(path):
+            for folder, dirs, names in os.walk(path):
+                dirs[:] = sorted(d for d in dirs if not d.startswith('.'))
+                files += [os.path.join(folder, name) for name in sorted(names)]
+        else:
+            files.append(path)
+    return files
+
+def modules(script):
+    ''' The script and the local modules it imports (recursively): modules
+    next to it or in its parent folder, as the scripts put on sys.path.
+    '''
+    found, todo = [], [os.path.join(root, script)]
+    while todo:
+        file = todo.pop()
+        if file in found:
+            continue
+        found.append(file)
+        with open(file) as f:
+            tree = ast.parse(f.read())
+        names = [alias.name for node in ast.walk(tree) if isinstance(node, ast.Import) for alias in node.names]
+        names += [node.module for node in ast.walk(tree) if isinstance(node, ast.ImportFrom) and node.module]
+        folder = os.path.dirname(os.path.join(root, script))
+        for name in names:
+            for candidate in [os.path.join(folder, f'{name}.py'), os.path.join(folder, '..', f'{name}.py')]:
+                if os.path.exists(candidate):
+                    todo.append(os.path.normpath(candidate))
+                    break
+    return sorted(found)
+
+def figure_hash(figure):
+    ''' sha1 over the code, arguments and inputs of a figure. '''
+    sha = hashlib.sha1(json.dumps(figure.get('args', [])).encode())
+    inputs = [file for pattern in figure['inputs'] for file in _files(pattern)]
+    for file in modules(figure['script']) + inputs:
+        sha.update(os.path.relpath(file, root).encode())
+        with open(file, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                sha.update(block)
+    return sha.hexdigest()
+
+def load_stamps():
+    stamps = os.path.join(build_dir, 'stamps.json')
+    if not os.path.exists(stamps):
+        return {}
+    with open(stamps) as f:
+        return json.load(f)
+
+def save_stamps(stamps):
+    os.makedirs(build_dir, exist_ok=True)
+    tmp = os.path.join(build_dir, 'stamps.json.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(stamps, f, indent=1)
+    os.replace(tmp, os.path.join(build_dir, 'stamps.json'))
+
+def render(name, figure, threads=1, locks=None):
+    ''' Run the script of a figure; returns (returncode, seconds) and writes
+    its output to results/.build/<name>.log. locks ({cache: lock}) are held
+    for the caches of the figure while it runs.
+    '''
+    held = [locks[cache] for cache in sorted(figure.get('caches', []))] if locks else []
+    for lock in held:
+        lock.acquire()
+    try:
+        return _render(name, figure, threads)
+    finally:
+        for lock in reversed(held):
+            lock.release()
+
+def _render(name, figure, threads):
+    env = dict(os.environ, MPLBACKEND='Agg', PYTHONUNBUFFERED='1')
+    for var in ['OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS']:
+        env[var] = str(threads) #the figures already run side by side
+    for output in figure['outputs']:
+        os.makedirs(os.path.dirname(os.path.join(root, output)), exist_ok=True)
+    tic = time.perf_counter()
+    with open(os.path.join(build_dir, f'{name}.log'), 'w') as log:
+        returncode = subprocess.call([sys.executable, figure['script']] + figure.get('args', []),
+                                     cwd=root, env=env, stdout=log, stderr=subprocess.STDOUT)
+    return returncode, time.perf_counter() - tic
+
+def build(names=None, force=False, workers=None):
+    ''' Render the given figures (all by default) that are out of date. '''
+    names = list(figures) if not names else names
+    stamps = load_stamps()
+    todo = {}
+    for name in names:
+        digest = figure_hash(figures[name])
+        outputs = all(os.path.exists(os.path.join(root, o)) for o in figures[name]['outputs'])
+        if force or stamps.get(name) != digest or not outputs:
+            todo[name] = digest
+        else:
+            print(f'Supplementary Figure {name}: up to date')
+    if not todo:
+        return stamps
+    os.makedirs(build_dir, exist_ok=True)
+    workers = workers or min(len(todo), os.cpu_count())
+    threads = max(1, os.cpu_count() // workers)
+    failed = []
+    locks = {cache: threading.Lock() for name in todo for cache in figures[name].get('caches', [])}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        jobs = {pool.submit(render, name, figures[name], threads, locks): name for name in todo}
+        for job in as_completed(jobs):
+            name = jobs[job]
+            returncode, seconds = job.result()
+            if returncode == 0:
+                stamps[name] = todo[name]
+                save_stamps(stamps)
+                print(f'Supplementary Figure {name}: built in {seconds:.1f} s')
+            else:
+                stamps.pop(name, None)
+                failed.append(name)
+                print(f'Supplementary Figure {name}: failed after {seconds:.1f} s, '
+                      f'see {os.path.relpath(os.path.join(build_dir, name + ".log"), root)}')
+    save_stamps(stamps)
+    if failed:
+        raise SystemExit(f'{len(failed)} figure(s) failed: {", ".join(failed)}')
+    return stamps
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Build the Supplementary Figures.')
+    parser.add_argument('figures', nargs='*', metavar='figure',
+                        help=f'figures to build ({", ".join(figures)}); all by default')
+    parser.add_argument('--force', action='store_true', help='rebuild even if up to date')
+    parser.add_argument('--workers', type=int, default=None, help='figures rendered at once')
+    args = parser.parse_args()
+    unknown = [name for name in args.figures if name not in figures]
+    if unknown:
+        parser.error(f'unknown figure(s): {", ".join(unknown)}')
+    build(args.figures, args.force, args.workers)
@@ -1,14 +1,18 @@
 ############################################################
 # This file plots the results from ISC as computed by the  #
 # ISCToolbox (Kauppi et al., 2014) for the pilot_iii data. #
+# (src/fmri/isc.py recomputes the same mean ISC maps).     #
 #                                                          #
 # author: ana.trianahoyos@aalto.fi 			   #
 ############################################################
 
+import os
+import sys
 import matplotlib.pyplot as plt
 import matplotlib
 
-from nilearn.plotting import plot_glass_brain
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from projections import plot_glass_brain #cached projections, same arguments as nilearn's
 
 buda = "./data/pilot_iii/fmri/ISC/budapest.nii.gz"
 pilot = "./data/pilot_iii/fmri/ISC/pilot.nii.gz"
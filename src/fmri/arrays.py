@@ -0,0 +1,111 @@
+###############################################################################
+# Named-array store for intermediate results                                  #
+#                                                                             #
+# A store is a folder with one uncompressed .npy file per array and a         #
+# meta.json (name, file, shape, dtype, order and description of each array,   #
+# plus free attributes). ArrayStore opens an array only when it is asked for, #
+# as a read-only memory map, so a single column or slice of a large matrix is #
+# read without loading the rest; save it with order='F' (column-major) when   #
+# columns are what is read. Nothing is unpickled (allow_pickle=False).        #
+#                                                                             #
+# convert_pickles() turns the old {name: array} pickles into a store, with an #
+# unpickler that only accepts numpy arrays, so a file from elsewhere cannot   #
+# run code. From the repository root:                                         #
+#   python src/fmri/arrays.py <store folder> <file.pickle> [...]              #
+###############################################################################
+
+import os
+import sys
+import json
+import pickle
+
+import numpy as np
+import pandas as pd
+
+class ArrayStore:
+    ''' Lazily memory-mapped named arrays of a store folder. '''
+    def __init__(self, folder):
+        self.folder = folder
+        with open(os.path.join(folder, 'meta.json')) as f:
+            self.meta = json.load(f)
+        self._arrays = {}
+
+    def keys(self):
+        return list(self.meta['arrays'])
+
+    def __contains__(self, name):
+        return name in self.meta['arrays']
+
+    def __getitem__(self, name):
+        if name not in self._arrays:
+            file = os.path.join(self.folder, self.meta['arrays'][name]['file'])
+            self._arrays[name] = np.load(file, mmap_mode='r', allow_pickle=False)
+        return self._arrays[name]
+
+    @property
+    def attrs(self):
+        return self.meta.get('attrs', {})
+
+    def describe(self):
+        ''' One row per array: shape, dtype, order and description. '''
+        return pd.DataFrame.from_dict(self.meta['arrays'], orient='index').drop(columns='file')
+
+def save(folder, arrays, descriptions=None, attrs=None, order='C'):
+    ''' Write the {name: array} dict as a store (replacing the arrays of the
+    same name) and return it opened. order is 'C' or 'F', for all the arrays
+    or as a {name: order} dict.
+    '''
+    os.makedirs(folder, exist_ok=True)
+    meta_file = os.path.join(folder, 'meta.json')
+    meta = {'arrays': {}, 'attrs': {}}
+    if os.path.exists(meta_file):
+        with open(meta_file) as f:
+            meta = json.load(f)
+    descriptions = descriptions or {}
+    for name, array in arrays.items():
+        layout = order.get(name, 'C') if isinstance(order, dict) else order
+        array = np.asarray(array)
+        array = np.asfortranarray(array) if layout == 'F' else np.ascontiguousarray(array)
+        file = f'{name}.npy'
+        tmp = os.path.join(folder, f'{name}.tmp.npy')
+        np.save(tmp, array, allow_pickle=False)
+        os.replace(tmp, os.path.join(folder, file))
+        meta['arrays'][name] = {'file': file, 'shape': list(array.shape), 'dtype': array.dtype.str,
+                                'order': layout, 'description': descriptions.get(name, '')}
+    meta['attrs'].update(attrs or {})
+    tmp = meta_file + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(meta, f, indent=1)
+    os.replace(tmp, meta_file)
+    return ArrayStore(folder)
+
+class _ArrayUnpickler(pickle.Unpickler):
+    #only what numpy needs to rebuild an ndarray, whatever the numpy version that wrote it
+    allowed = {('numpy', 'dtype'), ('numpy', 'ndarray'),
+               ('numpy.core.numeric', '_frombuffer'), ('numpy._core.numeric', '_frombuffer'),
+               ('numpy.core.multiarray', '_reconstruct'), ('numpy._core.multiarray', '_reconstruct'),
+               ('numpy.core.multiarray', 'scalar'), ('numpy._core.multiarray', 'scalar')}
+
+    def find_class(self, module, name):
+        if (module, name) not in self.allowed:
+            raise pickle.UnpicklingError(f'{module}.{name} is not allowed in an array pickle')
+        return super().find_class(module, name)
+
+def read_pickle(file):
+    ''' {name: array} of a pickled dict of numpy arrays, refusing anything else. '''
+    with open(file, 'rb') as f:
+        arrays = _ArrayUnpickler(f).load()
+    if not isinstance(arrays, dict) or not all(isinstance(a, np.ndarray) for a in arrays.values()):
+        raise ValueError(f'{file} is not a dict of arrays')
+    return arrays
+
+def convert_pickles(files, folder, descriptions=None, order='C'):
+    ''' Store the arrays of the pickles in folder (see save). '''
+    arrays = {}
+    for file in files:
+        arrays.update(read_pickle(file))
+    return save(folder, arrays, descriptions, {'converted_from': [os.path.basename(f) for f in files]}, order)
+
+if __name__ == "__main__":
+    store = convert_pickles(sys.argv[2:], sys.argv[1])
+    print(store.describe())
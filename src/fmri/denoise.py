@@ -0,0 +1,91 @@
+###############################################################################
+# Voxelwise confound regression (denoising) of a 4D BOLD image                #
+#                                                                             #
+# The design (Legendre polynomial trend up to order, then confound columns    #
+# of the fMRIPrep TSV, Friston-24 by default) is factored once with a         #
+# pivoted QR into an orthonormal basis Q of its column space, and the         #
+# residuals of all the voxels of a chunk are y - Q (Q'y), a pair of matrix    #
+# products. The BOLD image is read chunk by chunk from its float32 memory map #
+# in the voxel cache (see voxels.py), so the 4D array is never in memory.     #
+# The residuals are written to the cache of the output image (a later         #
+# voxels.load() of it is a memory map too), then to the NIfTI file.           #
+#                                                                             #
+# r is the correlation of each voxel before (detrended only) and after the    #
+# denoising, as r_brain.nii.gz of Supplementary Figure 5.                     #
+###############################################################################
+
+import os
+
+import numpy as np
+import pandas as pd
+import nibabel as nib
+from scipy.linalg import qr
+
+import voxels
+import motion
+
+friston24 = [f'{p}{suffix}' for suffix in ['', '_derivative1', '_power2', '_derivative1_power2']
+             for p in motion.motion_columns]
+
+def design(confounds_file, columns=friston24, order=1):
+    ''' T x p design: the Legendre polynomials up to order (constant
+    first), then the confound columns (nan, as the first derivative, set to
+    0). Returns the design and the number of trend columns.
+    '''
+    confounds = pd.read_csv(confounds_file, sep='\t', usecols=lambda column: column in columns, dtype=float)
+    missing = [column for column in columns if column not in confounds]
+    if missing:
+        raise ValueError(f'{confounds_file} has no column(s) {", ".join(missing)}')
+    trend = np.polynomial.legendre.legvander(np.linspace(-1, 1, len(confounds)), order)
+    return np.hstack([trend, confounds[columns].fillna(0).values]), trend.shape[1]
+
+def basis(X):
+    ''' Orthonormal basis of the column space of X (rank-deficient columns
+    dropped), so that y - Q (Q'y) are the OLS residuals of y on X.
+    '''
+    q, r, _ = qr(X, mode='economic', pivoting=True)
+    d = np.abs(np.diag(r))
+    rank = (d > d[0] * max(X.shape) * np.finfo(float).eps).sum() if len(d) else 0
+    return q[:, :rank]
+
+def denoise(bold, confounds_file, residual_file, r_file=None, columns=friston24, order=1,
+            scrub=None, chunk=2048):
+    ''' Regress the design out of every voxel of bold (a 4D NIfTI) and write
+    the residuals (float32, without the scrubbed volumes: scrub is a boolean
+    mask of the volumes to drop, e.g. motion.run_motion()['scrub']) to
+    residual_file and the before/after correlation to r_file. Returns r as a
+    3D array (0 outside the data).
+    '''
+    data = voxels.load(bold)
+    shape, T = data.shape[:3], data.shape[3]
+    keep = np.ones(T, dtype=bool) if scrub is None else ~np.asarray(scrub, dtype=bool)
+    X, ntrend = design(confounds_file, columns, order)
+    if len(X) != T:
+        raise ValueError(f'{confounds_file} has {len(X)} rows for {T} volumes')
+    full, trend = basis(X[keep]), basis(X[keep, :ntrend])
+
+    rows = data.reshape(-1, T)
+    os.makedirs(voxels.cache_dir(residual_file), exist_ok=True)
+    store = os.path.join(voxels.cache_dir(residual_file), voxels._stem(residual_file) + '.npy')
+    cache = np.lib.format.open_memmap(store, mode='w+', dtype=np.float32, shape=shape + (int(keep.sum()),))
+    residual = cache.reshape(len(rows), -1) #voxels x frames view of the 4D cache
+    r = np.zeros(len(rows), dtype=np.float32)
+    for start in range(0, len(rows), chunk):
+        y = rows[start:start + chunk][:, keep].T.astype(np.float64)
+        after = y - full @ (full.T @ y)
+        before = y - trend @ (trend.T @ y)
+        residual[start:start + chunk] = after.T
+        with np.errstate(invalid='ignore', divide='ignore'):
+            cor = (after*before).sum(axis=0) / np.sqrt((after*after).sum(axis=0) * (before*before).sum(axis=0))
+        r[start:start + chunk] = np.nan_to_num(cor)
+    cache.flush()
+
+    header = nib.load(bold).header.copy()
+    header.set_data_dtype(np.float32)
+    affine = voxels.affine(bold)
+    nib.Nifti1Image(cache, affine, header).to_filename(residual_file)
+    voxels.write_meta(residual_file, shape + (int(keep.sum()),), affine)
+    r = r.reshape(shape)
+    if r_file is not None:
+        nib.Nifti1Image(r, affine).to_filename(r_file)
+    return r
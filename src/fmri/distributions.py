@@ -0,0 +1,111 @@
+###############################################################################
+# Streaming distribution summaries of voxel values (violin plots)             #
+#                                                                             #
+# A Histogram keeps the count, sum, sum of squares, extremes and the counts   #
+# on a fixed grid of bins of every value it is given, chunk by chunk, so a    #
+# map of millions of voxels never has to be held (or padded and melted) in    #
+# memory. Quantiles are read from the cumulative counts and the KDE of a      #
+# violin is the binned histogram smoothed with a Gaussian (Scott bandwidth,   #
+# as seaborn), cut 2 bandwidths beyond the extremes.                          #
+###############################################################################
+
+import numpy as np
+import seaborn as sns
+
+import voxels
+
+class Histogram:
+    ''' Running summary of values on bins edges (values outside the edges
+    are only counted in the moments and the extremes).
+    '''
+    def __init__(self, edges):
+        self.edges = np.asarray(edges, dtype=float)
+        self.counts = np.zeros(len(self.edges) - 1, dtype=np.int64)
+        self.n = 0
+        self.sum = 0.
+        self.sumsq = 0.
+        self.min = np.inf
+        self.max = -np.inf
+
+    def update(self, values):
+        values = np.asarray(values, dtype=float).ravel()
+        if values.size == 0:
+            return self
+        self.n += values.size
+        self.sum += values.sum()
+        self.sumsq += (values*values).sum()
+        self.min = min(self.min, values.min())
+        self.max = max(self.max, values.max())
+        self.counts += np.histogram(values, bins=self.edges)[0]
+        return self
+
+    @property
+    def mean(self):
+        return self.sum / self.n
+
+    @property
+    def std(self):
+        return np.sqrt(max(self.sumsq/self.n - self.mean**2, 0.) * self.n/(self.n - 1))
+
+    def quantile(self, q):
+        #linear inside the bin, within the observed extremes
+        cum = np.concatenate(([0], np.cumsum(self.counts)))
+        values = np.interp(np.asarray(q, dtype=float) * cum[-1], cum, self.edges)
+        return np.clip(values, self.min, self.max)
+
+    def kde(self, points=200, cut=2):
+        ''' (coords, density) of the Gaussian KDE of the binned values. '''
+        centers = (self.edges[:-1] + self.edges[1:]) / 2
+        bw = self.std * self.n ** (-1 / 5)
+        coords = np.linspace(max(self.min - cut*bw, self.edges[0]), min(self.max + cut*bw, self.edges[-1]), points)
+        used = self.counts > 0
+        z = (coords[:, None] - centers[None, used]) / bw
+        density = (np.exp(-z*z/2) @ self.counts[used]) / (self.counts.sum() * bw * np.sqrt(2*np.pi))
+        return coords, density
+
+    def violin_stats(self, points=200):
+        ''' Statistics in the format of matplotlib's Axes.violin. '''
+        coords, density = self.kde(points)
+        return {'coords': coords, 'vals': density, 'mean': self.mean, 'median': self.quantile(.5),
+                'min': self.min, 'max': self.max, 'quantiles': self.quantile([.25, .75])}
+
+def summarize(files, mask, edges, chunk=1 << 20):
+    ''' {key: Histogram} of the nonzero voxel values of every volume of the
+    {key: nii path} dict, read from the voxel cache chunk by chunk through the
+    flat mask index.
+    '''
+    summaries = {}
+    for key, file in files.items():
+        volume = voxels.load(file).reshape(-1)
+        summary = Histogram(edges)
+        for start in range(0, len(mask), chunk):
+            values = volume[mask[start:start + chunk]]
+            summary.update(values[values != 0])
+        summaries[key] = summary
+    return summaries
+
+def violinplot(ax, summaries, order, hue_order, width=.8, palette=None, points=200):
+    ''' Grouped violins (x = order, hue = hue_order) from a {(x, hue): Histogram}
+    dict, with the interquartile range and median drawn inside as seaborn's
+    inner='box'. The first violin of each hue is labelled for the legend.
+    '''
+    colors = sns.color_palette(palette, len(hue_order))
+    step = width / len(hue_order)
+    for h, hue in enumerate(hue_order):
+        keys = [(x, hue) for x in order if (x, hue) in summaries]
+        positions = [order.index(x) - width/2 + step*(h + .5) for x, _ in keys]
+        stats = [summaries[key].violin_stats(points) for key in keys]
+        if not stats:
+            continue
+        parts = ax.violin(stats, positions=positions, widths=step*.95, showextrema=False)
+        for body in parts['bodies']:
+            body.set_facecolor(colors[h])
+            body.set_edgecolor('0.25')
+            body.set_alpha(1)
+        for pos, stat in zip(positions, stats):
+            ax.vlines(pos, *stat['quantiles'], color='0.25', linewidth=3)
+            ax.scatter(pos, stat['median'], color='white', s=8, zorder=3)
+        parts['bodies'][0].set_label(str(hue))
+    ax.set_xticks(range(len(order)))
+    ax.set_xticklabels(order)
+    return ax
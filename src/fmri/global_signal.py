@@ -0,0 +1,68 @@
+###############################################################################
+# Streaming global-signal correlation maps                                    #
+#                                                                             #
+# Two passes over the voxels x time rows of a run, chunk by chunk:            #
+#   1. the global signal, the mean over the brain voxels at every frame       #
+#   2. per voxel, the running sums of y, y^2 and y * (gs - mean gs), from     #
+#      which its Pearson correlation with the global signal follows           #
+# Nothing is z-scored, so no standardized copy of the run is ever made. Each  #
+# voxel is shifted by its first frame before squaring to keep the sums exact. #
+# A 4D NIfTI is read from its float32 memory map in the voxel cache (see      #
+# voxels.py); a time x voxel array (e.g. a denoised run) works the same.      #
+###############################################################################
+
+import numpy as np
+import pandas as pd
+import nibabel as nib
+
+import voxels
+
+def global_signal(rows, index, chunk=2048):
+    ''' Mean over the rows (voxels x frames) at index of every frame. '''
+    gs = np.zeros(rows.shape[1])
+    for start in range(0, len(index), chunk):
+        gs += rows[index[start:start + chunk]].sum(axis=0, dtype=np.float64)
+    return gs / len(index)
+
+def correlation(rows, index, gs, chunk=2048):
+    ''' Pearson correlation of the rows at index with gs (nan for a constant
+    row).
+    '''
+    g = gs - gs.mean()
+    sgg = (g*g).sum()
+    n = len(gs)
+    r = np.empty(len(index))
+    for start in range(0, len(index), chunk):
+        y = rows[index[start:start + chunk]].astype(np.float64)
+        y -= y[:, :1]
+        sy, syy, syg = y.sum(axis=1), (y*y).sum(axis=1), y @ g
+        with np.errstate(invalid='ignore', divide='ignore'):
+            r[start:start + chunk] = syg / np.sqrt((syy - sy*sy/n) * sgg)
+    return r
+
+def gs_correlation(data, mask=None, chunk=2048, r_file=None):
+    ''' Global signal of a run and the correlation of every voxel with it.
+
+    data is a 4D NIfTI path or a time x voxel array; mask is the flat (C
+    order) voxel index to use, by default voxels.brain_mask() of the NIfTI
+    or all the columns of the array. Returns (map, r, gs): a NIfTI of r (0
+    outside the mask, written to r_file if given; None for an array), r as a
+    Series indexed by voxel and the global signal.
+    '''
+    if isinstance(data, str):
+        rows = voxels.voxel_rows(data)
+        mask = voxels.brain_mask([data]) if mask is None else np.asarray(mask)
+    else:
+        rows = np.asarray(data).T
+        mask = np.arange(len(rows)) if mask is None else np.asarray(mask)
+    gs = global_signal(rows, mask, chunk)
+    r = pd.Series(correlation(rows, mask, gs, chunk), index=pd.Index(mask, name='voxel'), name='r')
+    img = None
+    if isinstance(data, str):
+        shape = voxels.load(data).shape[:3]
+        volume = np.zeros(int(np.prod(shape)), dtype=np.float32)
+        volume[mask] = np.nan_to_num(r.values)
+        img = nib.Nifti1Image(volume.reshape(shape), voxels.affine(data))
+        if r_file is not None:
+            img.to_filename(r_file)
+    return img, r, gs
@@ -0,0 +1,139 @@
+###############################################################################
+# Voxelwise inter-subject (inter-session) correlation of 4D runs              #
+#                                                                             #
+# The runs are read from their float32 memory maps in the voxel cache (see    #
+# voxels.py), one chunk of brain voxels at a time, on a process pool (one     #
+# BLAS thread per process). In a chunk every run is z-scored over time into   #
+# a voxels x runs x time block Z, and with S the sum of Z over the runs:      #
+#   mean pairwise ISC   (S.S - sum_i z_i.z_i) / (T n (n-1))                   #
+#   leave-one-out ISC   corr(z_i, S - z_i) for every run i, i.e. with the     #
+#                       mean of the other runs, each weighted equally         #
+#   pairwise ISC        Z Z' / T, the runs x runs matrix of every voxel       #
+#                       (one batched matrix product, only when asked for)     #
+# so the mean and leave-one-out maps cost O(n) per voxel instead of O(n^2).   #
+# The mean map is what the ISC Toolbox wrote (pilot.nii.gz, firstISC.nii.gz,  #
+# ... of plot_ISC.py). Runs of different length are cut to the shortest one.  #
+#                                                                             #
+#   python src/fmri/isc.py <mean map> <run> <run> [...] [--loo <file>]        #
+###############################################################################
+
+import os
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import nibabel as nib
+from threadpoolctl import threadpool_limits
+
+import voxels
+
+_runs = None
+
+def _init_worker(files):
+    global _runs
+    _runs = [voxels.voxel_rows(file) for file in files]
+    threadpool_limits(limits=1)
+
+def _zscore(y):
+    #population std, as the correlation; constant voxels are left at 0
+    y = y - y.mean(axis=-1, keepdims=True)
+    std = np.sqrt((y*y).mean(axis=-1, keepdims=True))
+    return np.divide(y, std, out=np.zeros_like(y), where=std > 0)
+
+def isc_block(index, frames, pairwise=False):
+    ''' Mean pairwise, leave-one-out (voxels x runs) and, if pairwise, the
+    runs x runs ISC of every voxel of the flat index, from the runs opened
+    by _init_worker.
+    '''
+    Z = np.stack([_zscore(rows[index, :frames].astype(np.float64)) for rows in _runs], axis=1)
+    n = Z.shape[1]
+    S = Z.sum(axis=1)
+    zz = np.einsum('vnt,vnt->vn', Z, Z)
+    zs = np.einsum('vnt,vt->vn', Z, S)
+    ss = np.einsum('vt,vt->v', S, S)
+    result = {'mean': (ss - zz.sum(axis=1)) / (frames * n * (n - 1))}
+    with np.errstate(invalid='ignore', divide='ignore'):
+        loo = (zs - zz) / np.sqrt(zz * (ss[:, None] - 2*zs + zz))
+    result['loo'] = np.nan_to_num(loo)
+    if pairwise:
+        result['pairwise'] = np.matmul(Z, Z.transpose(0, 2, 1)) / frames
+    return result
+
+def _run_block(start, index, frames, pairwise):
+    return start, isc_block(index, frames, pairwise)
+
+def isc(runs, mask=None, mean_file=None, loo_file=None, pairwise_file=None, pairwise=False,
+        workers=None, chunk=1024):
+    ''' ISC of the 4D runs (NIfTI paths, same voxel grid) over the flat (C
+    order) voxel index mask, a mask NIfTI or, by default, the voxels nonzero
+    in any run. Returns {'mean': 3D map, 'loo': 4D map (one frame per run)}
+    plus 'pairwise' (4D, one frame per pair in the order of 'pairs') if
+    pairwise or pairwise_file; the maps given a file are written there as
+    float32 NIfTI (0 outside the mask).
+    '''
+    global _runs
+    runs = list(runs)
+    if len(runs) < 2:
+        raise ValueError('ISC needs at least two runs')
+    metas = [voxels.build(run) for run in runs] #decompressed once, before the workers map them
+    shape = tuple(metas[0]['shape'][:3])
+    if any(tuple(meta['shape'][:3]) != shape for meta in metas):
+        raise ValueError('the runs are not on the same voxel grid')
+    frames = min(meta['shape'][3] for meta in metas)
+    if mask is None:
+        mask = voxels.brain_mask(runs)
+    elif isinstance(mask, str):
+        mask = np.flatnonzero(voxels.voxel_rows(mask).any(axis=1))
+    mask = np.asarray(mask)
+    pairwise = pairwise or pairwise_file is not None
+
+    n = len(runs)
+    pairs = [(i, j) for i in range(n) for j in range(i + 1, n)]
+    flat = {'mean': np.zeros(len(mask)), 'loo': np.zeros((len(mask), n))}
+    if pairwise:
+        flat['pairwise'] = np.zeros((len(mask), len(pairs)))
+    iu = np.triu_indices(n, 1)
+    starts = list(range(0, len(mask), chunk))
+    indices = [mask[start:start + chunk] for start in starts] #only its slice of the mask goes to a task
+    workers = workers or os.cpu_count()
+    if workers == 1:
+        _runs = [voxels.voxel_rows(run) for run in runs]
+        results = (_run_block(start, index, frames, pairwise) for start, index in zip(starts, indices))
+        pool = None
+    else:
+        pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(runs,))
+        results = pool.map(_run_block, starts, indices, [frames]*len(starts), [pairwise]*len(starts))
+    try:
+        for start, block in results:
+            stop = start + len(block['mean'])
+            flat['mean'][start:stop] = block['mean']
+            flat['loo'][start:stop] = block['loo']
+            if pairwise:
+                flat['pairwise'][start:stop] = block['pairwise'][:, iu[0], iu[1]]
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    affine = voxels.affine(runs[0])
+    maps = {}
+    for key, values in flat.items():
+        volume = np.zeros((int(np.prod(shape)),) + values.shape[1:], dtype=np.float32)
+        volume[mask] = values
+        maps[key] = volume.reshape(shape + values.shape[1:])
+    for key, file in [('mean', mean_file), ('loo', loo_file), ('pairwise', pairwise_file)]:
+        if file is not None:
+            nib.Nifti1Image(maps[key], affine).to_filename(file)
+    if pairwise:
+        maps['pairs'] = pairs
+    return maps
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Voxelwise ISC of 4D runs.')
+    parser.add_argument('mean_file', help='mean pairwise ISC map to write')
+    parser.add_argument('runs', nargs='+', help='4D NIfTI runs (same voxel grid)')
+    parser.add_argument('--mask', default=None, help='mask NIfTI (default: voxels nonzero in any run)')
+    parser.add_argument('--loo', default=None, help='leave-one-out ISC maps to write (one frame per run)')
+    parser.add_argument('--pairwise', default=None, help='pairwise ISC maps to write (one frame per pair)')
+    parser.add_argument('--workers', type=int, default=None, help='processes (default: all the cores)')
+    args = parser.parse_args()
+    isc(args.runs, args.mask, args.mean_file, args.loo, args.pairwise, workers=args.workers)
@@ -0,0 +1,95 @@
+###############################################################################
+# Motion quality control from the fMRIPrep confound files                     #
+#                                                                             #
+# Only the six rigid-body parameters (and std_dvars) are read from each       #
+# *_desc-confounds_timeseries.tsv. Framewise displacement is recomputed from  #
+# them (Power et al., 2012: sum of the absolute backward differences, the     #
+# rotations as arc length on a 50 mm sphere, nan on the first volume, as      #
+# fMRIPrep's framewise_displacement column) and volumes are flagged as        #
+# spikes when FD or std_dvars is above threshold (fMRIPrep's motion_outlier   #
+# defaults: 0.5 mm and 1.5). The scrub mask marks the spikes and, optionally, #
+# their neighbours, and can be passed as scrub to denoise.denoise().          #
+#                                                                             #
+# motion_qc() reads all the runs of a folder in parallel and returns one row  #
+# of metrics per run; a missing run is simply not in the table.               #
+###############################################################################
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import voxels
+
+motion_columns = ['trans_x', 'trans_y', 'trans_z', 'rot_x', 'rot_y', 'rot_z']
+suffix = '_desc-confounds_timeseries.tsv'
+
+def read_motion(file):
+    ''' (T x 6 rigid-body parameters in mm and radians, std_dvars or None). '''
+    wanted = motion_columns + ['std_dvars']
+    confounds = pd.read_csv(file, sep='\t', usecols=lambda column: column in wanted, dtype=float)
+    std_dvars = confounds['std_dvars'].values if 'std_dvars' in confounds else None
+    return confounds[motion_columns].values, std_dvars
+
+def framewise_displacement(params, radius=50.):
+    ''' FD of every volume of a T x 6 (or runs x T x 6) parameter array. '''
+    params = np.asarray(params, dtype=float)
+    delta = np.abs(np.diff(params, axis=-2))
+    fd = delta[..., :3].sum(axis=-1) + radius*delta[..., 3:].sum(axis=-1)
+    first = np.full(fd.shape[:-1] + (1,), np.nan)
+    return np.concatenate([first, fd], axis=-1)
+
+def spikes(fd, std_dvars=None, fd_threshold=0.5, dvars_threshold=1.5):
+    ''' Volumes with FD or std_dvars above threshold (nan is never a spike). '''
+    with np.errstate(invalid='ignore'):
+        spike = np.asarray(fd) > fd_threshold
+        if std_dvars is not None and dvars_threshold is not None:
+            spike |= np.asarray(std_dvars) > dvars_threshold
+    return spike
+
+def scrub_mask(spike, before=0, after=0):
+    ''' Volumes to remove: the spikes and the before/after volumes around
+    them (e.g. 1 and 2 as Power et al., 2014).
+    '''
+    spike = np.asarray(spike, dtype=bool)
+    scrub = spike.copy()
+    for shift in range(1, before + 1):
+        scrub[..., :-shift] |= spike[..., shift:]
+    for shift in range(1, after + 1):
+        scrub[..., shift:] |= spike[..., :-shift]
+    return scrub
+
+def run_motion(file, fd_threshold=0.5, dvars_threshold=1.5, before=0, after=0):
+    ''' Per-volume table of a run: fd, std_dvars, spike and scrub. '''
+    params, std_dvars = read_motion(file)
+    fd = framewise_displacement(params)
+    spike = spikes(fd, std_dvars, fd_threshold, dvars_threshold)
+    return pd.DataFrame({'fd': fd, 'std_dvars': np.nan if std_dvars is None else std_dvars,
+                         'spike': spike, 'scrub': scrub_mask(spike, before, after)})
+
+def run_metrics(series, fd_limits=(0.2, 0.5)):
+    ''' QC metrics of the per-volume table of a run. '''
+    fd = series['fd'].values[1:]
+    metrics = {'volumes': len(series), 'fd_mean': fd.mean(), 'fd_median': np.median(fd), 'fd_max': fd.max()}
+    for limit in fd_limits:
+        metrics[f'percent_fd>{limit}'] = 100*(fd > limit).sum()/len(series)
+    metrics['std_dvars_mean'] = series['std_dvars'].mean()
+    metrics['spikes'] = series['spike'].sum()
+    metrics['percent_scrubbed'] = 100*series['scrub'].mean()
+    return metrics
+
+def motion_qc(path, workers=8, fd_limits=(0.2, 0.5), **thresholds):
+    ''' QC of every confound file in path: a table of metrics per run
+    (indexed by session and task, sorted as voxels.list_runs) and the
+    {(session, task): per-volume table} of the runs. thresholds go to
+    run_motion (fd_threshold, dvars_threshold, before, after).
+    '''
+    runs = voxels.list_runs(path, suffix)
+    files = [os.path.join(path, file) for file in runs['file']]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        series = list(pool.map(lambda file: run_motion(file, **thresholds), files))
+    table = pd.DataFrame([run_metrics(s, fd_limits) for s in series],
+                         index=pd.MultiIndex.from_frame(runs[['session', 'task']]))
+    table.insert(0, 'file', runs['file'].values)
+    return table, dict(zip(table.index, series))
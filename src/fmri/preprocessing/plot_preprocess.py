@@ -10,7 +10,10 @@ Outputs: - Plot of correlations of confounds
     
 NOTE: The carpet plots require the original data, which is only available 
 by writing to researchdata@aalto.fi. Therefore, the carpet plots will be left 
-blank.
+blank. The denoising itself (GLM with the Friston-24 motion parameters and 
+detrending, and the before/after correlation map r) is denoise.denoise() in 
+src/fmri/denoise.py, and the global signal and its correlation map (r_gs_brain) 
+are global_signal.gs_correlation() in src/fmri/global_signal.py.
 
 @author: ana.trianahoyos@aalto.fi
 Created: 19.02.2021
@@ -19,6 +22,7 @@ Modified: 27.07.2024
 """
 
 import os
+import sys
 import matplotlib.pyplot as plt
 from matplotlib.colors import ListedColormap
 from matplotlib import cm
@@ -26,10 +30,10 @@ import matplotlib
 import matplotlib.gridspec as gridspec
 import numpy as np
 from scipy import stats
-import pickle
-import nibabel as nib
 
-from nilearn.plotting import plot_glass_brain
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from projections import plot_glass_brain #cached projections, same arguments as nilearn's
+import arrays
 
 import warnings
 warnings.filterwarnings("ignore", category=FutureWarning)
@@ -44,23 +48,16 @@ savepath = './results/pilot_iii/'
 #No further modifications needed
 
 # Load all the data
-r_brain = nib.load(os.path.join(os.path.abspath(path),'r_brain.nii.gz'))
-r_gs_brain = nib.load(os.path.join(os.path.abspath(path),'r_gs_brain.nii.gz'))
+r_brain = os.path.join(os.path.abspath(path),'r_brain.nii.gz')
+r_gs_brain = os.path.join(os.path.abspath(path),'r_gs_brain.nii.gz')
 
-with open(os.path.join(os.path.abspath(path),'SF5_postpro.pickle'), 'rb') as handle:
-    postpro = pickle.load(handle)['postpro']
-
-with open(os.path.join(os.path.abspath(path),'SF5_postpro_det.pickle'), 'rb') as handle:
-    postpro_det = pickle.load(handle)['postpro_det']
-
-with open(os.path.join(os.path.abspath(path),'SF5_postpro_det_gs.pickle'), 'rb') as handle:
-    postpro_det_gs = pickle.load(handle)['postpro_det_gs']
-    
-with open(os.path.join(os.path.abspath(path),'SF5_postpro_gs.pickle'), 'rb') as handle:
-    postpro_gs = pickle.load(handle)['postpro_gs']
-
-with open(os.path.join(os.path.abspath(path),'SF5_r.pickle'), 'rb') as handle:
-    r = pickle.load(handle)['r']
+#intermediate results as memory-mapped arrays (converted from the SF5_*.pickle files with ../arrays.py)
+sf5 = arrays.ArrayStore(os.path.join(os.path.abspath(path),'SF5'))
+postpro = sf5['postpro']
+postpro_det = sf5['postpro_det']
+postpro_det_gs = sf5['postpro_det_gs']
+postpro_gs = sf5['postpro_gs']
+r = sf5['r']
         
 font = {'size': 12}
 matplotlib.rc('font', **font)
@@ -115,7 +112,7 @@ ax7.plot(postpro_gs, color='darkblue', linestyle='-', linewidth=1, label='global
 ax7.set_ylabel('signal')
 ax7.set_xlabel('TR')
 ax7.set_ylim(-5,5)
-cor, _ = stats.pearsonr(stats.zscore(postpro[:,45609]),postpro_gs)
+cor, _ = stats.pearsonr(stats.zscore(postpro),postpro_gs) #postpro holds voxel 45609 only
 ax7.text(0,3,f'corr: {round(cor,3)}')
 ax7.legend(ncol=2, loc='lower right', fontsize=10, frameon=False)
         
@@ -0,0 +1,150 @@
+###############################################################################
+# Cached glass-brain projections shared by the fMRI figure scripts            #
+#                                                                             #
+# nilearn's plot_glass_brain reads, reorders and thresholds the whole volume  #
+# and takes its maximum-intensity projections on every call. project() does   #
+# that once per volume (keyed by the sha1 of the file and the threshold,      #
+# plot_abs and resampling arguments) and keeps the 2D projection along every  #
+# direction (x, y, z, l, r) with the bounds and value range of the volume in  #
+# <folder>/.voxel_cache/glass-<name>-<key>.npz. plot_glass_brain() takes the  #
+# same arguments as nilearn's and draws the figure from that cache, so a new  #
+# colormap, vmax, colorbar or display mode does not touch the volume again.   #
+# This relies on private nilearn functions (written against nilearn 0.10);    #
+# if they are missing, plot_glass_brain() falls back to nilearn's, uncached.  #
+###############################################################################
+
+import os
+import json
+import hashlib
+
+import numpy as np
+from nilearn import plotting
+from nilearn.plotting import cm
+from nilearn.image import reorder_img, new_img_like
+from nilearn.image.resampling import get_bounds, get_mask_bounds
+try:
+    from nilearn.plotting.img_plotting import _get_colorbar_and_data_ranges
+    from nilearn.plotting.displays import BaseSlicer, GlassBrainAxes
+    from nilearn._utils import check_niimg_3d
+    from nilearn._utils.extmath import fast_abs_percentile
+    from nilearn._utils.niimg import _is_binary_niimg, _safe_get_data
+    cached_plotting = hasattr(BaseSlicer, '_show_colorbar') and hasattr(GlassBrainAxes, 'draw_2d')
+except ImportError:
+    cached_plotting = False
+
+import voxels
+
+directions = 'xyzlr'
+
+def file_hash(file, chunk=1 << 20):
+    sha = hashlib.sha1()
+    with open(file, 'rb') as f:
+        for block in iter(lambda: f.read(chunk), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+def _mip(data, affine, direction, plot_abs):
+    ''' Maximum-intensity projection along direction, as nilearn's
+    GlassBrainAxes.transform_to_2d (l and r keep one hemisphere).
+    '''
+    axis = 0 if direction in 'xlr' else '.yz'.index(direction)
+    selection = data
+    if direction in 'lr':
+        x_center = int(np.linalg.inv(affine).dot([0, 0, 0, 1])[0])
+        selection = data[:x_center] if direction == 'l' else data[x_center:]
+        if selection.shape[0] == 0:
+            selection = data
+    if plot_abs:
+        return np.rot90(np.abs(selection).max(axis=axis))
+    index = list(np.indices([s for i, s in enumerate(selection.shape) if i != axis]))
+    index.insert(axis, np.abs(selection).argmax(axis=axis))
+    return np.rot90(selection[tuple(index)])
+
+def _project(nii_path, threshold, plot_abs, resampling_interpolation):
+    #the steps of plot_glass_brain up to the images it draws
+    img = check_niimg_3d(nii_path, dtype='auto')
+    data = _safe_get_data(img, ensure_finite=True)
+    if threshold == 'auto':
+        threshold = fast_abs_percentile(data) - 1e-5
+    value_range = np.array([np.nanmin(data), np.nanmax(data)], dtype=float)
+    img = new_img_like(img, data, img.affine)
+    img = reorder_img(img, resample='nearest' if _is_binary_niimg(img) else resampling_interpolation)
+    data = _safe_get_data(img, ensure_finite=True)
+    if threshold is not None:
+        threshold = float(threshold)
+        data = np.ma.masked_equal(data, 0, copy=False) if threshold == 0 else \
+               np.ma.masked_inside(data, -threshold, threshold, copy=False)
+    data_bounds = get_bounds(data.shape, img.affine)
+    bounding_box = data_bounds
+    if isinstance(np.ma.getmask(data), np.ndarray):
+        bounding_box = np.reshape(get_mask_bounds(new_img_like(img, ~data.mask, img.affine)), (3, 2))
+    arrays = {'data_bounds': np.array(data_bounds, dtype=float), 'bounding_box': np.array(bounding_box, dtype=float),
+              'range': value_range, 'threshold': np.nan if threshold is None else threshold}
+    for direction in directions:
+        projection = _mip(data, img.affine, direction, plot_abs)
+        arrays[direction] = np.ma.getdata(projection)
+        arrays[direction + '_mask'] = np.ma.getmaskarray(projection)
+    return arrays
+
+def project(nii_path, threshold='auto', plot_abs=True, resampling_interpolation='continuous'):
+    ''' Projections of the volume along every direction (masked arrays where
+    the volume is thresholded), its data bounds, the bounding box of the
+    voxels above threshold, its value range and the threshold used, from the
+    cache if the same file was projected with the same arguments before.
+    '''
+    params = [file_hash(nii_path), threshold, bool(plot_abs), resampling_interpolation]
+    key = hashlib.sha1(json.dumps(params).encode()).hexdigest()[:16]
+    store = os.path.join(voxels.cache_dir(nii_path), f'glass-{voxels._stem(nii_path)}-{key}.npz')
+    if os.path.exists(store):
+        with np.load(store) as cached:
+            arrays = dict(cached)
+    else:
+        arrays = _project(nii_path, threshold, plot_abs, resampling_interpolation)
+        os.makedirs(voxels.cache_dir(nii_path), exist_ok=True)
+        tmp = store + '.tmp.npz'
+        np.savez(tmp, **arrays)
+        os.replace(tmp, store)
+    threshold = None if np.isnan(arrays['threshold']) else float(arrays['threshold'])
+    projections = {d: arrays[d] if threshold is None else np.ma.masked_array(arrays[d], arrays[d + '_mask'])
+                   for d in directions}
+    return {'projections': projections, 'data_bounds': [tuple(b) for b in arrays['data_bounds']],
+            'bounding_box': [tuple(b) for b in arrays['bounding_box']], 'range': arrays['range'],
+            'threshold': threshold}
+
+def plot_glass_brain(nii_path, display_mode='ortho', colorbar=False, cbar_tick_format="%.2g",
+                     figure=None, axes=None, title=None, threshold='auto', annotate=True,
+                     black_bg=False, cmap=None, alpha=0.7, vmin=None, vmax=None, plot_abs=True,
+                     symmetric_cbar='auto', resampling_interpolation='continuous', **kwargs):
+    ''' nilearn.plotting.plot_glass_brain(nii_path, ...) drawn from the cached
+    projections: the empty glass brain is drawn by nilearn and the
+    projections are added to its axes as nilearn's add_overlay does. As
+    there, vmin is ignored (the color range is -vmax..vmax). Without the
+    private nilearn functions this needs, nilearn's own is called.
+    '''
+    if not cached_plotting:
+        return plotting.plot_glass_brain(nii_path, display_mode=display_mode, colorbar=colorbar,
+                                         cbar_tick_format=cbar_tick_format, figure=figure, axes=axes,
+                                         title=title, threshold=threshold, annotate=annotate,
+                                         black_bg=black_bg, cmap=cmap, alpha=alpha, vmin=vmin, vmax=vmax,
+                                         plot_abs=plot_abs, symmetric_cbar=symmetric_cbar,
+                                         resampling_interpolation=resampling_interpolation, **kwargs)
+    cached = project(nii_path, threshold, plot_abs, resampling_interpolation)
+    if cmap is None:
+        cmap = cm.cold_hot if black_bg else cm.cold_white_hot
+    cbar_vmin, cbar_vmax, vmin, vmax = _get_colorbar_and_data_ranges(
+        cached['range'], vmax, symmetric_cbar, kwargs, 0 if plot_abs else None)
+    display = plotting.plot_glass_brain(None, display_mode=display_mode, colorbar=colorbar, figure=figure,
+                                        axes=axes, title=title, annotate=annotate, black_bg=black_bg,
+                                        alpha=alpha, plot_abs=plot_abs)
+    display._colorbar = colorbar
+    display._cbar_tick_format = cbar_tick_format
+    kwargs.setdefault('interpolation', 'nearest')
+    ims = []
+    for direction, display_ax in display.axes.items():
+        projection = cached['projections'][direction]
+        if projection.min() is not np.ma.masked: #nothing above threshold
+            ims.append(display_ax.draw_2d(projection, cached['data_bounds'], cached['bounding_box'],
+                                          type='imshow', cmap=cmap, vmin=vmin, vmax=vmax, **kwargs))
+    if colorbar and ims:
+        display._show_colorbar(ims[0].cmap, ims[0].norm, cbar_vmin, cbar_vmax, cached['threshold'])
+    return display
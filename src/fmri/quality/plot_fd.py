@@ -9,12 +9,15 @@
 ###############################################################################
 
 import os
+import sys
 import seaborn as sns
 import matplotlib.pyplot as plt
 import matplotlib
 
 import numpy as np
-import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import motion
 
 path = './data/pilot_iii/fmri/' 
 savepath = './results/pilot_iii'
@@ -22,26 +25,26 @@ savepath = './results/pilot_iii'
 tasks = ['pvt', 'resting', 'movie', 'nback']
 sessions = ['ses-01', 'ses-02', 'ses-03']
 
-fd = {}
-for session in sessions:
-    fd[session] = {}
-    for task in tasks:
-        confound = pd.read_csv(os.path.join(os.path.abspath(path), f'sub-01_{session}_task-{task}_acq-highfreq_run-1_desc-confounds_timeseries.tsv'),sep='\t')
-        fd[session][task] = confound['framewise_displacement']
+#FD recomputed from the motion parameters of every confound file found, and the scrub masks
+qc, runs = motion.motion_qc(path)
+print(qc.drop(columns='file').round(3))
 
 fig, axes = plt.subplots(nrows=3, ncols=4, sharex=False, sharey=True, figsize=(12,8))
 font = {'family' : 'Arial','size': 14}
 matplotlib.rc('font', **font)
-for i, session in enumerate(fd.keys()):
-    for j, task in enumerate(fd[session].keys()):
+for i, session in enumerate(sessions):
+    for j, task in enumerate(tasks):
         ax = axes[i,j]
-        num = (100*fd[session][task].where(fd[session][task]>0.2).count())/len(fd[session][task])
-        ax = sns.lineplot(data=fd[session][task],x=np.linspace(0,len(fd[session][task]),num=len(fd[session][task])),y=fd[session][task],ax=ax)
-        #ax.set_title(f'{round(num,2)}% of TRs affected')
+        if (session, task) not in runs:
+            ax.text(0.5, 0.5, 'no confounds', transform=ax.transAxes, ha='center', va='center')
+            continue
+        fd = runs[(session, task)]['fd']
+        ax = sns.lineplot(data=fd,x=np.linspace(0,len(fd),num=len(fd)),y=fd,ax=ax)
+        #ax.set_title(f"{round(qc.loc[(session, task), 'percent_fd>0.2'],2)}% of TRs affected")
         ax.set_ylabel("framewise \n displacement")
         ax.set_xlabel("TR")
-        ax.hlines(y=0.2, xmin=0,xmax=len(fd[session][task]), linewidth=2,color='r',linestyle='dashed')
-        ax.hlines(y=0.5, xmin=0,xmax=len(fd[session][task]), linewidth=2,color='r',linestyle='dashed')
+        ax.hlines(y=0.2, xmin=0,xmax=len(fd), linewidth=2,color='r',linestyle='dashed')
+        ax.hlines(y=0.5, xmin=0,xmax=len(fd), linewidth=2,color='r',linestyle='dashed')
         ax.set_ylim(0,0.6)
         if task=="resting":
             ax.set_xlim(0,706)
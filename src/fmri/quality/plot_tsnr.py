@@ -8,16 +8,17 @@
 ###############################################################################
 
 import os
+import sys
 import seaborn as sns
 import matplotlib.pyplot as plt
 import matplotlib.colors as mcolors
 import matplotlib
 import numpy as np
-import pandas as pd
 
-import nibabel as nib
-
-from nilearn.plotting import plot_glass_brain
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import voxels
+import distributions
+from projections import plot_glass_brain #cached projections, same arguments as nilearn's
 
 
 def symmetrical_colormap(cmap_settings, new_name = None ):
@@ -44,50 +45,26 @@ def symmetrical_colormap(cmap_settings, new_name = None ):
 path = './data/pilot_iii/fmri/tsnr/' 
 savepath = './results/pilot_iii'
 
-files = os.listdir(path)
-to_plot = {}
-nback = list(filter(lambda x: 'nback' in x, files))
-nback.sort()
-to_plot["nback"] = nback
-pvt = list(filter(lambda x: 'pvt' in x, files))
-pvt.sort()
-to_plot["pvt"] = pvt
-movie = list(filter(lambda x: 'movie' in x, files))
-movie.sort()
-to_plot["movie"] = movie
-resting = list(filter(lambda x: 'resting' in x, files))
-resting.sort()
-to_plot["resting"] = resting
+runs = voxels.list_runs(path) #file, session and task of every tSNR map
+to_plot = {task: list(group['file']) for task, group in runs.groupby('task', sort=False)}
 titles = ["ses-01", "ses-02", "ses-03"]
 
 cmap_settings = ('hot', None)
 mymap = symmetrical_colormap(cmap_settings= cmap_settings, new_name =None )
 
 ########################### Violin plot ######################################
-dfs=[]
-for key in to_plot.keys():
-    violin = {}
-    for i,file in enumerate(pvt):
-        print(os.path.join(path, file))
-        nii = nib.load(os.path.join(path, file))
-        data = nii.get_fdata()
-        data[np.isnan(data)] = 0
-        violin[titles[i]] = data[np.nonzero(data)]
-    maxsize = max([a.size for a in violin.values()])
-    violin_pad = {k:np.pad(v, pad_width=(0,maxsize-v.size,), mode='constant', constant_values=np.nan) for k,v in violin.items()}
-    df = pd.DataFrame(violin_pad)
-    df.reset_index(inplace=True)
-    df = pd.melt(df, id_vars=['index'], value_vars=['ses-01', 'ses-02', 'ses-03'])
-    df["task"] = key
-    dfs.append(df)
-violin_plot = pd.concat(dfs)
+#histograms of the nonzero voxels of every map (0.5 tSNR bins), read in chunks through a shared brain mask
+files = {(task, session): os.path.join(path, file) for file, session, task in runs.values}
+mask = voxels.brain_mask(list(files.values()))
+summaries = distributions.summarize(files, mask, edges=np.linspace(-100, 1000, 2201))
 
 fig, ax = plt.subplots(dpi=200)
 sns.set_theme(font="Arial")
 sns.set_style("ticks")
 font = {'family' : 'Arial','size': 14}
 matplotlib.rc('font', **font)
-ax = sns.violinplot(data=violin_plot, x="task", y="value", hue="variable", order=["pvt", "resting", "movie", "nback"])
+ax = distributions.violinplot(ax, summaries, order=["pvt", "resting", "movie", "nback"], hue_order=titles)
+ax.set(xlabel="task", ylabel="value")
 ax.set_ylim((0,450))
 plt.legend(loc='upper center', ncol=3)
 sns.despine()
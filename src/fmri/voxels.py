@@ -0,0 +1,141 @@
+###############################################################################
+# Memory-mapped voxel cache shared by the fMRI figure scripts                 #
+#                                                                             #
+# A NIfTI volume is decompressed once into <folder>/.voxel_cache/<name>.npy   #
+# (float32, nan as 0) with a meta.json holding its shape, affine and the      #
+# size/modification time of the source; later reads memory-map that file.     #
+# brain_mask() stores one flat voxel index shared by a set of volumes, so     #
+# only the voxels inside it are ever copied into memory.                      #
+#                                                                             #
+# The scripts are run from the repository root and put src/fmri on sys.path   #
+# to import this module.                                                      #
+###############################################################################
+
+import os
+import re
+import json
+import hashlib
+
+import numpy as np
+import pandas as pd
+import nibabel as nib
+
+def cache_dir(nii_path):
+    return os.path.join(os.path.dirname(os.path.abspath(nii_path)), '.voxel_cache')
+
+def _stem(nii_path):
+    return re.sub(r'\.nii(\.gz)?$', '', os.path.basename(nii_path))
+
+def _source_stamp(nii_path):
+    stat = os.stat(nii_path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+def build(nii_path, force=False, block_bytes=1 << 28):
+    ''' Decompress nii_path into its cache (if stale) and return its meta.
+    A 4D volume is copied block_bytes of frames at a time.
+    '''
+    store = os.path.join(cache_dir(nii_path), _stem(nii_path))
+    meta_file = store + '.json'
+    stamp = _source_stamp(nii_path)
+    if not force and os.path.exists(meta_file):
+        with open(meta_file) as f:
+            meta = json.load(f)
+        if meta['source'] == stamp:
+            return meta
+
+    nii = nib.load(nii_path, keep_file_open=True)
+    shape = nii.shape[:3] if nii.ndim == 4 and nii.shape[3] == 1 else nii.shape
+    os.makedirs(cache_dir(nii_path), exist_ok=True)
+    data = np.lib.format.open_memmap(store + '.npy', mode='w+', dtype=np.float32, shape=shape)
+    if len(shape) == 4:
+        #the NIfTI is frame-major, so a .nii.gz is decompressed once, front to back, a block
+        #of frames at a time; the cache is voxel-major (C order X, Y, Z, T), so every block is
+        #a strided write across the whole cache file: the one-off copy makes T / step passes
+        #over it, hence blocks as large as the memory budget allows
+        step = max(16, block_bytes // (4 * int(np.prod(shape[:3]))))
+        for t in range(0, shape[3], step):
+            frames = np.asarray(nii.dataobj[..., t:t + step], dtype=np.float32)
+            data[..., t:t + step] = np.nan_to_num(frames, nan=0.)
+    else:
+        data[...] = np.asarray(nii.dataobj, dtype=np.float32).reshape(shape)
+        np.nan_to_num(data, copy=False, nan=0.)
+    data.flush()
+    del data
+    return write_meta(nii_path, shape, nii.affine)
+
+def write_meta(nii_path, shape, affine):
+    ''' Record <name>.npy in the cache as the voxels of nii_path (as it is on
+    disk now) and return the meta.
+    '''
+    meta_file = os.path.join(cache_dir(nii_path), _stem(nii_path) + '.json')
+    meta = {'source': _source_stamp(nii_path), 'file': _stem(nii_path) + '.npy', 'shape': list(shape),
+            'affine': np.asarray(affine).tolist()}
+    tmp = meta_file + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(meta, f)
+    os.replace(tmp, meta_file) #the meta goes last: without it the volume is rebuilt
+    return meta
+
+def load(nii_path):
+    ''' Read-only float32 memory map of the volume (nan read as 0). '''
+    meta = build(nii_path)
+    return np.load(os.path.join(cache_dir(nii_path), meta['file']), mmap_mode='r')
+
+def affine(nii_path):
+    return np.array(build(nii_path)['affine'])
+
+def voxel_rows(nii_path):
+    ''' Memory map of the volume as voxels x frames (1 frame for a 3D one). '''
+    data = load(nii_path)
+    return data.reshape(int(np.prod(data.shape[:3])), -1)
+
+def brain_mask(nii_paths, chunk=1 << 14):
+    ''' Flat (C order) indices of the voxels that are nonzero in any of the
+    volumes (at any frame of a 4D one), cached per set of volumes.
+    '''
+    stamps = json.dumps([[os.path.abspath(p), _source_stamp(p)] for p in sorted(nii_paths)])
+    key = hashlib.sha1(stamps.encode()).hexdigest()[:16]
+    store = os.path.join(cache_dir(nii_paths[0]), f'mask-{key}.npy')
+    if os.path.exists(store):
+        return np.load(store)
+    mask = None
+    for path in nii_paths:
+        rows = voxel_rows(path)
+        nonzero = np.concatenate([(rows[start:start + chunk] != 0).any(axis=1)
+                                  for start in range(0, len(rows), chunk)])
+        mask = nonzero if mask is None else mask | nonzero
+    index = np.flatnonzero(mask)
+    tmp = store + '.tmp.npy'
+    np.save(tmp, index)
+    os.replace(tmp, store)
+    return index
+
+def masked(nii_path, mask):
+    ''' Values of the volume at the mask index (a float32 copy of mask size). '''
+    return load(nii_path).reshape(-1)[mask]
+
+def list_runs(path, suffix='.nii.gz'):
+    ''' Table of the BIDS volumes in path (file, session, task), sorted by task
+    and session.
+    '''
+    runs = []
+    for file in os.listdir(path):
+        match = re.search(r'ses-(\w+?)_task-(\w+?)_', file)
+        if match and file.endswith(suffix):
+            runs.append((file, f'ses-{match.group(1)}', match.group(2)))
+    runs = pd.DataFrame(runs, columns=['file', 'session', 'task'])
+    return runs.sort_values(['task', 'session'], ignore_index=True)
+
+def run_voxels(path, suffix='.nii.gz'):
+    ''' {(task, session): nonzero voxel values} of every volume in path, read
+    through one brain mask shared by all of them (as data[np.nonzero(data)]
+    on each volume, in float32).
+    '''
+    runs = list_runs(path, suffix)
+    files = [os.path.join(path, file) for file in runs['file']]
+    mask = brain_mask(files)
+    voxels = {}
+    for file, session, task in zip(files, runs['session'], runs['task']):
+        values = masked(file, mask)
+        voxels[(task, session)] = values[values != 0]
+    return voxels